@@ -0,0 +1,9 @@
+"""
+Makes the pipeline scripts importable from the tests, as they are when snakemake runs them.
+"""
+
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / 'workflow' / 'scripts'))
@@ -0,0 +1,33 @@
+"""
+Selection of the best records per group by filter_tsv.
+"""
+
+import csv
+from filter_tsv import filter_by_group
+
+COLUMNS = ['record_id', 'bin_uri', 'nuc_basecount', 'ranking']
+
+def filtered(tmp_path, rows, **kwargs):
+    ranked = tmp_path / 'result_output.tsv'
+    with open(ranked, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+        writer.writerow(COLUMNS)
+        writer.writerows(rows)
+    output = tmp_path / 'result_output_filtered.tsv'
+    filter_by_group(str(ranked), str(output), {'ranking'}, **kwargs)
+    with open(output, encoding='utf-8') as f:
+        return [row['record_id'] for row in csv.DictReader(f, delimiter='\t')]
+
+def test_unranked_records_sort_last(tmp_path):
+    rows = [['a', 'BIN1', '', '0'], ['b', 'BIN1', '', '6'], ['c', 'BIN2', '', '0'], ['d', 'BIN3', '', '']]
+    assert filtered(tmp_path, rows) == ['b', 'c']
+    assert filtered(tmp_path, rows, top_k=2) == ['b', 'a', 'c']
+
+def test_numeric_tie_break_with_empty_values_last(tmp_path):
+    rows = [['a', 'BIN1', '', '2'], ['b', 'BIN1', '650', '2'], ['c', 'BIN1', '10', '2'], ['d', 'BIN1', '9', '2'], ['e', 'BIN1', '5', '3']]
+    assert filtered(tmp_path, rows, tie_break='nuc_basecount') == ['d']
+    assert filtered(tmp_path, rows, tie_break='nuc_basecount', top_k=4) == ['d', 'c', 'b', 'a']
+
+def test_text_tie_break(tmp_path):
+    rows = [['b', 'BIN1', 'x', '1'], ['a', 'BIN1', 'x', '1']]
+    assert filtered(tmp_path, rows, tie_break='record_id') == ['a']
@@ -0,0 +1,61 @@
+"""
+Carrying results forward between snapshots with incremental.
+"""
+
+import pandas as pd
+from incremental import write_fingerprints, split, merge
+
+CRITERIA = ['SPECIES_ID', 'COUNTRY']
+
+def write_tsv(path, rows, columns):
+    pd.DataFrame(rows, columns=columns).to_csv(path, sep='\t', index=False)
+    return str(path)
+
+def read_tsv(path):
+    return pd.read_csv(path, sep='\t', dtype=str, keep_default_na=False)
+
+def test_merge_carries_results_forward(tmp_path):
+    columns = ['record_id', 'bin_uri', 'elev']
+    records = [['R1', 'BIN1', '5'], ['R2', 'BIN1', ''], ['R3', 'BIN2', '7'], ['R4', 'BIN2', 'NA'], ['R5', '', '9']]
+    bold_data_tsv = write_tsv(tmp_path / 'records.tsv', records, columns)
+    delta_output = write_tsv(tmp_path / 'delta_output.tsv', [['R2', 'BIN1', '', 1, 0, 3], ['R5', '', '9', 1, '', 4]],
+                             columns + CRITERIA + ['ranking'])
+    previous_output = write_tsv(tmp_path / 'previous_output.tsv', [['R1', 'BIN1', '5', 1, 1, 2], ['R2', 'BIN1', '', 0, 0, 0],
+                                                                   ['R3', 'BIN2', '7', '', 1, 0], ['R6', 'BIN3', '', 1, 1, 2]],
+                                columns + CRITERIA + ['ranking'])
+    output = tmp_path / 'result_output.tsv'
+    merge(bold_data_tsv, CRITERIA, delta_output, previous_output, str(output), chunk_size=2, run_size=2)
+
+    merged = read_tsv(output)
+    assert merged[columns].values.tolist() == records
+    assert merged[CRITERIA + ['ranking']].values.tolist() == [['1', '1', '2'], ['1', '0', '3'], ['', '1', '0'], ['', '', '0'], ['1', '', '4']]
+
+    merge(bold_data_tsv, CRITERIA, delta_output, previous_output, str(output), chunk_size=2, run_size=2, full=True)
+    assert read_tsv(output)['ranking'].tolist() == ['0', '3', '0', '0', '4']
+
+def test_split_finds_changed_records_and_bins(tmp_path):
+    columns = ['record_id', 'bin_uri', 'species', 'country/ocean', 'elev']
+    previous = [['R1', 'BIN1', 'a', 'X', '1'], ['R2', 'BIN1', 'b', 'X', '1'], ['R3', 'BIN2', 'c', 'X', '1'], ['R4', 'BIN3', 'd', 'X', '1'],
+                ['R5', 'BIN4', 'e', 'X', '1'], ['R4', 'BIN7', 'd', 'X', '1']]
+    current = [['R2', 'BIN1', 'b', 'X', '1'], ['R1', 'BIN1', 'a2', 'X', '1'], ['R3', 'BIN5', 'c', 'X', '1'], ['R6', 'BIN6', 'f', 'X', ''],
+               ['R5', 'BIN4', 'e', 'X', '2'], ['R6', 'BIN6', 'f', 'X', '']]
+    previous_fingerprints = tmp_path / 'previous_fingerprints.tsv'
+    write_fingerprints(write_tsv(tmp_path / 'previous.tsv', previous, columns), CRITERIA, str(previous_fingerprints))
+    bold_data_tsv = write_tsv(tmp_path / 'current.tsv', current, columns)
+
+    def split_records(full):
+        paths = {name: str(tmp_path / name) for name in ('fingerprints.tsv', 'delta.tsv', 'affected_bins.txt')}
+        split(bold_data_tsv, CRITERIA, str(previous_fingerprints), paths['fingerprints.tsv'], paths['delta.tsv'], paths['affected_bins.txt'],
+              chunk_size=2, run_size=2, full=full)
+        with open(paths['affected_bins.txt']) as f:
+            return read_tsv(paths['delta.tsv']).values.tolist(), f.read().split(), read_tsv(paths['fingerprints.tsv'])
+
+    delta, affected_bins, fingerprints = split_records(full=False)
+    assert delta == [current[1], current[2], current[3], current[5]]
+    assert affected_bins == ['BIN1', 'BIN2', 'BIN3', 'BIN5', 'BIN6']
+    write_fingerprints(bold_data_tsv, CRITERIA, str(tmp_path / 'expected_fingerprints.tsv'))
+    assert fingerprints.equals(read_tsv(tmp_path / 'expected_fingerprints.tsv'))
+
+    delta, affected_bins, _ = split_records(full=True)
+    assert delta == current
+    assert affected_bins == ['BIN1', 'BIN2', 'BIN3', 'BIN4', 'BIN5', 'BIN6']
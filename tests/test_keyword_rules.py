@@ -0,0 +1,56 @@
+"""
+Parity of the keyword rules with the per-row lambdas they replaced (including their keywords
+with capitals, which never matched the lower-cased text).
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from conftest import ROOT
+from keyword_rules import load_keyword_rules, assess_keyword_rule
+
+TYPES = ['holotype', 'lectotype', 'isotype', 'syntype', 'paratype', 'neotype', 'allotype', 'paralectotype', 'hapantotype', 'cotype']
+VOUCHER_POS = ['herb', 'museum', 'registered', 'type', 'national', 'CBG', 'INHS', 'deposit', 'harbarium', 'hebarium', 'holot']
+VOUCHER_NEG = ['DNA', 'e-vouch', 'privat', 'no voucher', 'unvouchered', 'destr', 'lost', 'missing', 'no specimen', 'none',
+               'not vouchered', 'person', 'Photo Voucher Only', 'not registered']
+CBG = ['Kate Perez', 'Angela Telfer', 'BOLD ID Engine']
+METHOD_POS = ['descr', 'det', 'diss', 'exam', 'expert', 'genit', 'identifier', 'key', 'label', 'literature', 'micros', 'mor',
+              'taxonomic', 'type', 'vou', 'guide', 'flora', 'specimen', 'traditional', 'visual', 'wing', 'logical', 'knowledge',
+              'photo', 'verified', 'key']
+METHOD_NEG = ['barco', 'BOLD', 'CO1', 'COI', 'COX', 'DNA', 'mole', 'phylo', 'sequ', 'tree', 'bin', 'silva', 'ncbi', 'engine',
+              'blast', 'genbank', 'genetic', 'its']
+INST_NEG = ['genbank', 'no voucher', 'personal', 'private', 'research collection of', 'unknown', 'unvouchered']
+
+LEGACY = {
+    'TYPE_SPECIMEN': lambda x: 1 if any(t in str(x).lower() for t in TYPES) else 0,
+    'PUBLIC_VOUCHER': lambda x: 1 if any(p in str(x).lower() for p in VOUCHER_POS) and not any(n in str(x).lower() for n in VOUCHER_NEG) else 0,
+    'IDENTIFIER': lambda x: 0 if x in CBG or pd.isnull(x) else 1,
+    'ID_METHOD': lambda x: 1 if any(p in str(x).lower() for p in METHOD_POS) and not any(n in str(x).lower() for n in METHOD_NEG) else 0,
+    'INSTITUTION': lambda x: 0 if any(n in str(x).lower() for n in INST_NEG) or pd.isnull(x) else 1,
+}
+
+# Mixed case, missing and numeric values, and every keyword in upper, lower and title case
+VALUES = [np.nan, None, '', 0, 12, 3.5, 'nan', 'None', 'NaN', 'Kate Perez', 'kate perez', 'BOLD ID Engine', 'Holotype of X',
+          'PARATYPE', 'Museum (DNA extract)', 'Photo Voucher Only', 'photo voucher only', 'Vouchered: Registered Collection',
+          'Morphology; COI barcode', 'Morphological key', 'DNA Barcoding', 'Private Collection', 'Personal collection',
+          'Research Collection of A. Smith', 'Centre for Biodiversity Genomics', 'CBG', 'INHS museum', 'herbarium', 'e-voucher']
+VALUES += [case(keyword) for keywords in (TYPES, VOUCHER_POS, VOUCHER_NEG, CBG, METHOD_POS, METHOD_NEG, INST_NEG)
+           for keyword in keywords for case in (str.lower, str.upper, str.title)]
+
+@pytest.fixture(scope='module')
+def rules():
+    return load_keyword_rules(ROOT / 'resources' / 'keyword_rules.tsv')
+
+@pytest.mark.parametrize('criterion', sorted(LEGACY))
+@pytest.mark.parametrize('dtype', [object, 'category'])
+def test_matches_legacy_lambdas(rules, criterion, dtype):
+    series = pd.Series(VALUES, dtype=object)
+    expected = series.apply(LEGACY[criterion]).to_numpy()
+    assessed = assess_keyword_rule(series.astype(dtype) if dtype == 'category' else series, rules[criterion])
+    assert assessed.tolist() == expected.tolist()
+
+def test_keywords_with_capitals_are_rejected(tmp_path):
+    rules_tsv = tmp_path / 'keyword_rules.tsv'
+    rules_tsv.write_text("criterion\tcolumn\tpolarity\tmatch\tkeyword\nID_METHOD\tidentification_method\texclude\tsubstring\tDNA\n")
+    with pytest.raises(ValueError, match='lower case'):
+        load_keyword_rules(rules_tsv)
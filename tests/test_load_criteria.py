@@ -0,0 +1,32 @@
+"""
+Quarantine of malformed lines by load_criteria.
+"""
+
+import csv
+from load_criteria import load_criteria
+
+HEADER = b'processid\trecord_id\tidentification_method\tnuc_basecount\n'
+
+def loaded(tmp_path, lines):
+    snapshot = tmp_path / 'snapshot.tsv'
+    snapshot.write_bytes(HEADER + b''.join(lines))
+    output, quarantine = tmp_path / 'bold_with_criteria.tsv', tmp_path / 'quarantine.tsv'
+    load_criteria(str(snapshot), str(output), str(quarantine))
+    with open(output, encoding='utf-8', newline='') as f:
+        records = [row['record_id'] for row in csv.DictReader(f, delimiter='\t')]
+    with open(quarantine, encoding='utf-8', newline='') as f:
+        rejected = [(row['line_number'], row['reason']) for row in csv.DictReader(f, delimiter='\t')]
+    return records, rejected
+
+def test_carriage_return_in_field_is_quarantined(tmp_path):
+    lines = [b'P1\tR1\tmorphology\t650\n', b'P2\tR2\tA\rc\t2\n', b'P3\tR3\tBIN\t\r\n', b'P4\tR4\tx\t1']
+    records, rejected = loaded(tmp_path, lines)
+    assert records == ['R1', 'R3', 'R4']
+    assert rejected == [('3', 'carriage return in field')]
+
+def test_malformed_lines_are_quarantined(tmp_path):
+    lines = [b'P1\tR1\tmorphology\n', b'P2\tR2\t\xff\t1\n', b'\tR3\tx\t1\n', b'P4\tR4\tx\tmany\n', b'P5\tR5\tx\t1\n']
+    records, rejected = loaded(tmp_path, lines)
+    assert records == ['R5']
+    assert rejected == [('2', 'expected 4 fields, found 3'), ('3', 'invalid UTF-8'), ('4', 'missing processid'),
+                        ('5', 'non-numeric nuc_basecount')]
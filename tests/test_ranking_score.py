@@ -0,0 +1,95 @@
+"""
+Parity of the bitmask ranking with the per-row ranking it replaced, and the ranked output.
+"""
+
+import itertools
+import numpy as np
+import pandas as pd
+import pytest
+from conftest import ROOT
+from ranking_score import load_ranking_tiers, build_rank_lookup, calculate_rankings, ranking_score
+
+CRITERIA = ['SPECIES_ID', 'TYPE_SPECIMEN', 'SEQ_QUALITY', 'HAS_IMAGE', 'COLLECTORS', 'COLLECTION_DATE', 'COUNTRY', 'SITE',
+            'COORD', 'IDENTIFIER', 'ID_METHOD', 'INSTITUTION', 'PUBLIC_VOUCHER', 'MUSEUM_ID']
+
+def legacy_ranking(row):
+    if row.get('SPECIES_ID') == 1:
+        if row.get('TYPE_SPECIMEN') == 1:
+            return 1
+        elif (row.get('SEQ_QUALITY') == 1 and row.get('HAS_IMAGE') == 1 and row.get('COLLECTORS') == 1 and
+              row.get('COLLECTION_DATE') == 1 and row.get('COUNTRY') == 1 and row.get('SITE') == 1 and row.get('COORD') == 1 and
+              row.get('IDENTIFIER') == 1 and (row.get('ID_METHOD') == 1 or row.get('INSTITUTION') == 1) and
+              (row.get('PUBLIC_VOUCHER') == 1 or row.get('MUSEUM_ID') == 1)):
+            return 2
+        elif (row.get('SEQ_QUALITY') == 1 and row.get('HAS_IMAGE') == 1 and row.get('COUNTRY') == 1 and
+              (row.get('IDENTIFIER') == 1 or row.get('ID_METHOD') == 1) and
+              (row.get('INSTITUTION') == 1 or row.get('PUBLIC_VOUCHER') == 1 or row.get('MUSEUM_ID') == 1)):
+            return 3
+        elif row.get('SEQ_QUALITY') == 1 and row.get('HAS_IMAGE') == 1 and row.get('COUNTRY') == 1:
+            return 4
+        elif row.get('SEQ_QUALITY') == 1 and row.get('HAS_IMAGE') == 1:
+            return 5
+        elif row.get('SEQ_QUALITY') == 1:
+            return 6
+    return None
+
+RANKING_TIERS_TSV = ROOT / 'resources' / 'ranking_tiers.tsv'
+CRITERIA_TSV = ROOT / 'resources' / 'criteria.tsv'
+
+def rank(df):
+    tiers, criteria = load_ranking_tiers(RANKING_TIERS_TSV, CRITERIA_TSV)
+    return calculate_rankings(df, criteria, build_rank_lookup(tiers, criteria))
+
+def legacy_rank(df):
+    return df.apply(legacy_ranking, axis=1).fillna(0).astype(int).to_numpy()
+
+def test_every_combination_of_criteria():
+    df = pd.DataFrame(list(itertools.product([0, 1], repeat=len(CRITERIA))), columns=CRITERIA)
+    assert (rank(df) == legacy_rank(df)).all()
+
+def test_unknown_criteria_are_rejected(tmp_path):
+    tiers_tsv = tmp_path / 'ranking_tiers.tsv'
+    tiers_tsv.write_text("rank\trequirements\n1\tSPECIES_ID TYPE_SPECIMEN\n2\tSPECIES_ID SEQ_QUALTY|HAS_IMAGE\n")
+    with pytest.raises(ValueError, match='Ranking tier 2 requires criteria not defined in .*: SEQ_QUALTY'):
+        load_ranking_tiers(tiers_tsv, CRITERIA_TSV)
+
+def test_missing_values_and_columns():
+    # Missing values as the legacy ranking read them (float NaN)
+    rng = np.random.default_rng(1)
+    df = pd.DataFrame(rng.choice([0, 1, 1, 1, np.nan], (5000, len(CRITERIA))), columns=CRITERIA)
+    assert (rank(df) == legacy_rank(df)).all()
+    assert (rank(df.astype('Int8')) == legacy_rank(df)).all()
+    assert (rank(df.drop(columns='HAS_IMAGE')) == legacy_rank(df.drop(columns='HAS_IMAGE'))).all()
+
+def test_records_pass_through_unchanged(tmp_path):
+    # A numeric column that is only filled in for the first chunk of records
+    records = pd.DataFrame({'record_id': [f"R{i}" for i in range(2500)], 'elev': [str(i) if i < 1500 else '' for i in range(2500)],
+                            'identification': ['NA'] * 2500})
+    records.to_csv(tmp_path / 'records.tsv', sep='\t', index=False)
+    pd.DataFrame({'record_id': records['record_id'], 'SPECIES_ID': 1}).to_csv(tmp_path / 'concatenated.tsv', sep='\t', index=False)
+
+    outputs = []
+    for chunk_size in (1000, 10000):
+        output = tmp_path / f"result_output_{chunk_size}.tsv"
+        ranking_score(str(tmp_path / 'concatenated.tsv'), str(tmp_path / 'records.tsv'), str(output), RANKING_TIERS_TSV,
+                      chunk_size=chunk_size, criteria_tsv=CRITERIA_TSV)
+        outputs.append(output.read_bytes())
+    assert outputs[0] == outputs[1]
+    ranked = pd.read_csv(tmp_path / 'result_output_1000.tsv', sep='\t', dtype=str, keep_default_na=False)
+    assert ranked[records.columns].equals(records)
+
+def test_sort_merge_join(tmp_path):
+    records = pd.DataFrame({'record_id': ['NA', 'R2', 'R3', 'R2'], 'elev': ['1', '', '2', '3']})
+    records.to_csv(tmp_path / 'records.tsv', sep='\t', index=False)
+    criteria = pd.DataFrame({'record_id': ['R3', 'NA', 'R4', 'R2'], 'SPECIES_ID': [1, '', 1, 1], 'TYPE_SPECIMEN': [1, 0, 1, '']})
+    for name, rows in (('aligned', [1, 3, 0, 3]), ('shuffled', [0, 1, 3, 1])):
+        criteria.iloc[rows].to_csv(tmp_path / f"{name}.tsv", sep='\t', index=False)
+    outputs = []
+    for name in ('aligned', 'shuffled'):
+        output = tmp_path / f"result_output_{name}.tsv"
+        ranking_score(str(tmp_path / f"{name}.tsv"), str(tmp_path / 'records.tsv'), str(output), RANKING_TIERS_TSV,
+                      criteria_tsv=CRITERIA_TSV)
+        outputs.append(output.read_text())
+    assert outputs[0] == outputs[1]
+    ranked = pd.read_csv(tmp_path / 'result_output_shuffled.tsv', sep='\t', dtype=str, keep_default_na=False)
+    assert ranked.values.tolist() == [['NA', '1', '', '0', '0'], ['R2', '', '1', '', '0'], ['R3', '2', '1', '1', '1'], ['R2', '3', '1', '', '0']]
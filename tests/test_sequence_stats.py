@@ -0,0 +1,51 @@
+"""
+Batch nucleotide statistics against a per-sequence pure-Python reference, and SEQ_QUALITY
+against the lambda it replaced.
+"""
+
+import re
+import numpy as np
+import pandas as pd
+import pytest
+from sequence_stats import STATS_COLUMNS, sequence_stats, assess_sequence_quality
+
+def reference_stats(sequence):
+    """
+    Statistics of one sequence, in the order of STATS_COLUMNS.
+    """
+    sequence = sequence if isinstance(sequence, str) else ''
+    stripped = sequence.lstrip('-')
+    leading = len(sequence) - len(stripped)
+    core = stripped.rstrip('-')
+    length = len(sequence) - sequence.count('-')
+    if length == 0:
+        return [0, 0, 0, 0, leading, 0]
+    return [length, sum(c not in 'ACGTUacgtu-' for c in sequence), sequence.count('N') + sequence.count('n'),
+            len(re.findall('-+', core)), leading, len(stripped) - len(core)]
+
+def random_sequences(count, seed=1):
+    rng = np.random.default_rng(seed)
+    alphabet = np.array(list('ACGTACGTACGTacgtu-----NnRYKMSWBDHV?é'))
+    sequences = [''.join(rng.choice(alphabet, rng.integers(0, 800))) for _ in range(count)]
+    return sequences + [np.nan, None, '', '-', '----', 'A', '-A-', 'A--C', '--ACGT--', 'NNNN', 'é-é']
+
+@pytest.mark.parametrize('batch_records', [1, 7, 10000])
+def test_matches_reference(batch_records):
+    sequences = pd.Series(random_sequences(300), dtype=object)
+    stats = sequence_stats(sequences, batch_records)
+    assert list(stats.columns) == STATS_COLUMNS
+    assert stats.to_numpy().tolist() == [reference_stats(sequence) for sequence in sequences]
+
+def test_empty_series():
+    assert len(sequence_stats(pd.Series([], dtype=object))) == 0
+
+def test_seq_quality_matches_legacy_lambda():
+    sequences = pd.Series(random_sequences(2000, seed=2) + ['A' * 500, 'A' * 501, '-' * 10 + 'A' * 501], dtype=object)
+    legacy = sequences.apply(lambda x: 1 if isinstance(x, str) and len(x.replace('-', '')) > 500 else 0)
+    assessed = assess_sequence_quality(sequence_stats(sequences), {'min_length': 500, 'max_ambiguity': 1, 'max_gap_runs': None})
+    assert assessed.tolist() == legacy.tolist()
+
+def test_thresholds():
+    stats = pd.DataFrame([[600, 6, 0, 2, 0, 0], [600, 7, 0, 0, 0, 0], [600, 0, 0, 3, 0, 0]], columns=STATS_COLUMNS)
+    assert assess_sequence_quality(stats, {'min_length': 500, 'max_ambiguity': 0.01, 'max_gap_runs': None}).tolist() == [1, 0, 1]
+    assert assess_sequence_quality(stats, {'min_length': 500, 'max_ambiguity': 0.01, 'max_gap_runs': 2}).tolist() == [1, 0, 0]
@@ -0,0 +1,26 @@
+"""
+Normalization of taxon names for matching the target list.
+"""
+
+import pytest
+from target_list import normalize_name
+
+@pytest.mark.parametrize('name, normalized', [
+    ('Bombus terrestris', 'bombus terrestris'),
+    ('Bombus terrestris (Linnaeus, 1758)', 'bombus terrestris'),
+    ('Bombus terrestris Linnaeus, 1758', 'bombus terrestris'),
+    ('Bombus  terrestris  Linnaeus 1758', 'bombus terrestris'),
+    ('Bombus_terrestris', 'bombus terrestris'),
+    ('KAPETER CHOPHYLU', 'kapeter chophylu'),
+    ('BOMBUS TERRESTRIS (LINNAEUS, 1758)', 'bombus terrestris'),
+    ('BOMBUS TERRESTRIS LINNAEUS, 1758', 'bombus terrestris'),
+    ('Bombus Terrestris', 'bombus terrestris'),
+    ('Bombus sp. 1', 'bombus sp. 1'),
+    ('Bombus', 'bombus'),
+])
+def test_normalize_species(name, normalized):
+    assert normalize_name(name) == normalized
+
+def test_normalize_genus():
+    assert normalize_name('Bombus terrestris', 'genus') == 'bombus'
+    assert normalize_name('BOMBUS', 'genus') == 'bombus'
@@ -1,110 +1,82 @@
 """
 Script: access_criteria.py
-Description: This script assesses a specified criterion for each record in the BOLD data.
+Description: This script assesses one or more criteria for each record in the BOLD data.
 Input: 
     - bold_data_tsv: Path to the input BOLD data TSV file.
     - criterion: The criterion to be assessed.
+    - criteria: String of criteria separated by spaces, assessed together in a single pass.
     - image_url: Boolean flag to specify whether the image_url file should be generated.
+    - keyword_rules: Path to the keyword rules TSV file used by the text criteria.
+    - image_api_url: URL of the images API used for HAS_IMAGE.
+    - image_cache: Path to the SQLite cache of HAS_IMAGE lookups, with its TTL in days.
+    - shard / workers: Byte-range shard of the records to assess, or number of processes
+                       assessing shards of the local criteria.
+    - seq_min_length / seq_max_ambiguity / seq_max_gap_runs: Thresholds of SEQ_QUALITY.
+    - memory_mb: Memory budget; the records are assessed in byte-range chunks that fit in it.
 Output: 
-    - output_tsv: Path to the output TSV file containing the assessed criterion.
+    - output_tsv: Path to the output TSV file containing the assessed criteria.
+    - output_npy_dir: Directory for the criteria as int8 arrays named accessed_{criterion}.npy (columnar backend).
     - image_url_tsv: Path to the output TSV file containing the image URLs (if specified).
+    - seq_stats_tsv: Path to the output TSV file with the nucleotide statistics behind SEQ_QUALITY (if specified).
 """
 
+import os
+import io
+import contextlib
+import numpy as np
 import pandas as pd
 import argparse
 import logging
 import asyncio
-from aiohttp import ClientSession, ClientTimeout
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from has_image import assess_has_image, BASE_URL
+from image_cache import ImageCache
+from columnar import column_path, to_int8, finish_column
+from keyword_rules import load_keyword_rules, assess_keyword_rule
+from sharding import parse_shard, shard_ranges, chunk_ranges, read_range
+import memory_budget
+from sequence_stats import sequence_stats, assess_sequence_quality, THRESHOLDS, STATS_COLUMNS
+import instrumentation
 
-# Constants for HAS_IMAGE criterion
-BASE_URL = 'https://caos.boldsystems.org:443/api/images?processids='
-IMAGE_URL = 'https://caos.boldsystems.org:443/api/objects/'
-CHUNK_SIZE = 200  # Increased chunk size for better performance
-SLEEP = 0.5  # seconds
-MAX_RETRIES = 3  # Maximum number of retries for failed requests
-CONCURRENT_REQUESTS = 300  # Limit the number of concurrent requests
+# Declarative keyword lists for the text criteria
+KEYWORD_RULES_TSV = 'resources/keyword_rules.tsv'
 
-async def fetch_images(session, process_ids, retries=0):
-    try:
-        async with session.get(BASE_URL + process_ids, timeout=ClientTimeout(total=60)) as response:
-            if response.status == 200:
-                return await response.json()
-            else:
-                logging.error(f"Failed to fetch images: {response.status} {response.reason}")
-                if retries < MAX_RETRIES:
-                    logging.info(f"Retrying... ({retries + 1}/{MAX_RETRIES})")
-                    await asyncio.sleep(SLEEP)
-                    return await fetch_images(session, process_ids, retries + 1)
-                else:
-                    raise Exception(f"Failed to fetch images after {MAX_RETRIES} retries: {response.status} {response.reason}")
-    except asyncio.TimeoutError:
-        logging.error(f"Timeout error for process_ids: {process_ids}")
-        if retries < MAX_RETRIES:
-            logging.info(f"Retrying... ({retries + 1}/{MAX_RETRIES})")
-            await asyncio.sleep(SLEEP)
-            return await fetch_images(session, process_ids, retries + 1)
-        else:
-            raise
-
-async def assess_has_image(df, image_url_flag, image_url_tsv):
-    results = []
-    image_urls = []
-
-    async with ClientSession() as session:
-        tasks = []
-        for i in range(0, len(df), CHUNK_SIZE):
-            chunk = df.iloc[i:i+CHUNK_SIZE]
-            process_ids = ','.join(chunk['processid'].astype(str))
-            tasks.append(fetch_images(session, process_ids))
-
-            # Limit the number of concurrent requests
-            if len(tasks) >= CONCURRENT_REQUESTS:
-                responses = await asyncio.gather(*tasks, return_exceptions=True)
-                tasks = []
-                for response, chunk in zip(responses, [df.iloc[i:i+CHUNK_SIZE] for i in range(0, len(df), CHUNK_SIZE)]):
-                    if isinstance(response, Exception):
-                        logging.error(f"Error fetching images for chunk: {response}")
-                        continue
-                    for record in chunk.itertuples():
-                        match = next((item for item in response if item['processid'] == record.processid), None)
-                        if match:
-                            results.append((record.record_id, 1))
-                            if image_url_flag:
-                                image_urls.append((record.record_id, IMAGE_URL + match['objectid']))
-                        else:
-                            results.append((record.record_id, 0))
-
-        # Process any remaining tasks
-        if tasks:
-            responses = await asyncio.gather(*tasks, return_exceptions=True)
-            for response, chunk in zip(responses, [df.iloc[i:i+CHUNK_SIZE] for i in range(0, len(df), CHUNK_SIZE)]):
-                if isinstance(response, Exception):
-                    logging.error(f"Error fetching images for chunk: {response}")
-                    continue
-                for record in chunk.itertuples():
-                    match = next((item for item in response if item['processid'] == record.processid), None)
-                    if match:
-                        results.append((record.record_id, 1))
-                        if image_url_flag:
-                            image_urls.append((record.record_id, IMAGE_URL + match['objectid']))
-                    else:
-                        results.append((record.record_id, 0))
-
-    results_df = pd.DataFrame(results, columns=['record_id', 'HAS_IMAGE'])
-    if image_url_flag:
-        image_urls_df = pd.DataFrame(image_urls, columns=['record_id', 'image_url'])
-        image_urls_df.to_csv(image_url_tsv, sep='\t', index=False)
-    return results_df
-
-def access_criteria(bold_data_tsv, criterion, output_tsv, image_url_flag):
+# Columns of the BOLD data read by each criterion (record_id is always read as well)
+CRITERION_COLUMNS = {
+    'SPECIES_ID': ['species'],
+    'TYPE_SPECIMEN': ['taxonomy_notes'],
+    'SEQ_QUALITY': ['nuc'],
+    'PUBLIC_VOUCHER': ['voucher_type'],
+    'HAS_IMAGE': ['processid'],
+    'IDENTIFIER': ['identified_by'],
+    'ID_METHOD': ['identification_method'],
+    'COLLECTORS': ['collectors'],
+    'COLLECTION_DATE': ['collection_date_start', 'collection_date_end'],
+    'COUNTRY': ['country/ocean'],
+    'SITE': ['site'],
+    'COORD': ['coord'],
+    'INSTITUTION': ['inst'],
+    'MUSEUM_ID': ['museumid'],
+}
+
+# Low-cardinality columns, read as categoricals; keyword rules on them are evaluated once per category
+CATEGORICAL_COLUMNS = {'country/ocean', 'inst', 'identified_by', 'identification_method', 'voucher_type'}
+
+def read_bold_columns(bold_data_tsv, criteria, byte_range=None):
     """
-    Assesses a specified criterion for each record in the BOLD data.
+    Reads only the columns of the BOLD data needed to assess the given criteria,
+    optionally only the records in a byte range of the file. All columns are read as
+    text (or as categories of text), so every shard of the file is parsed the same way.
     """
-    logging.basicConfig(filename='logs/access_criteria.log', level=logging.INFO)
-    logging.info(f"Assessing criterion: {criterion}")
+    columns = {'record_id'}
+    for criterion in criteria:
+        columns.update(CRITERION_COLUMNS[criterion])
 
     try:
-        df = pd.read_csv(bold_data_tsv, sep='\t', low_memory=False)
+        source = io.BytesIO(read_range(bold_data_tsv, byte_range)) if byte_range else bold_data_tsv
+        df = pd.read_csv(source, sep='\t', usecols=lambda c: c in columns,
+                         dtype={column: 'category' if column in CATEGORICAL_COLUMNS else str for column in columns})
     except FileNotFoundError:
         logging.error(f"File not found: {bold_data_tsv}")
         raise
@@ -115,61 +87,202 @@ def access_criteria(bold_data_tsv, criterion, output_tsv, image_url_flag):
         logging.error(f"Error reading file {bold_data_tsv}: {e}")
         raise
 
-    if criterion == 'HAS_IMAGE':
-        image_url_tsv = output_tsv.replace("accessed_HAS_IMAGE.tsv", "image_urls.tsv")
-        results_df = asyncio.run(assess_has_image(df, image_url_flag, image_url_tsv))
-        results_df.to_csv(output_tsv, sep='\t', index=False)
-        return
+    for column in sorted(columns):
+        if column not in df.columns:
+            logging.error(f"Column '{column}' not found in the input file.")
+            raise KeyError(f"Column '{column}' not found in the input file.")
+    return df
+
+def assess_criterion(df, criterion, keyword_rules, seq_thresholds=THRESHOLDS):
+    """
+    Assesses a single local (non-network) criterion and returns it as a 0/1 series.
+    Text criteria are evaluated with the vectorized matchers from the keyword rules,
+    SEQ_QUALITY with the batch nucleotide statistics (taken from df if already computed).
+    """
+    if criterion in keyword_rules:
+        rule = keyword_rules[criterion]
+        return assess_keyword_rule(df[rule['column']], rule)
     elif criterion == 'SPECIES_ID':
-        df['SPECIES_ID'] = df['species'].apply(lambda x: 1 if pd.notnull(x) and 'sp.' not in x else 0)
+        species = df['species']
+        return (species.notna() & ~species.astype(str).str.contains('sp.', regex=False, na=False)).astype(int)
     elif criterion == 'SEQ_QUALITY':
-        if 'nuc' in df.columns:
-            df['SEQ_QUALITY'] = df['nuc'].apply(lambda x: 1 if isinstance(x, str) and len(x.replace('-', '')) > 500 else 0)
-        else:
-            logging.error("Column 'nuc' not found in the input file.")
-            raise KeyError("Column 'nuc' not found in the input file.")
-    elif criterion == 'TYPE_SPECIMEN':
-        types = ['holotype', 'lectotype', 'isotype', 'syntype', 'paratype', 'neotype', 'allotype', 'paralectotype', 'hapantotype', 'cotype']
-        df['TYPE_SPECIMEN'] = df['taxonomy_notes'].apply(lambda x: 1 if any(t in str(x).lower() for t in types) else 0)
-    elif criterion == 'PUBLIC_VOUCHER':
-        pos = ['herb', 'museum', 'registered', 'type', 'national', 'CBG', 'INHS', 'deposit', 'harbarium', 'hebarium', 'holot']
-        neg = ['DNA', 'e-vouch', 'privat', 'no voucher', 'unvouchered', 'destr', 'lost', 'missing', 'no specimen', 'none', 'not vouchered', 'person', 'Photo Voucher Only', 'not registered']
-        df['PUBLIC_VOUCHER'] = df['voucher_type'].apply(lambda x: 1 if any(p in str(x).lower() for p in pos) and not any(n in str(x).lower() for n in neg) else 0)
-    elif criterion == 'IDENTIFIER':
-        cbg = ['Kate Perez', 'Angela Telfer', 'BOLD ID Engine']
-        df['IDENTIFIER'] = df['identified_by'].apply(lambda x: 0 if x in cbg or pd.isnull(x) else 1)
-    elif criterion == 'ID_METHOD':
-        pos = ['descr', 'det', 'diss', 'exam', 'expert', 'genit', 'identifier', 'key', 'label', 'literature', 'micros', 'mor', 'taxonomic', 'type', 'vou', 'guide', 'flora', 'specimen', 'traditional', 'visual', 'wing', 'logical', 'knowledge', 'photo', 'verified', 'key']
-        neg = ['barco', 'BOLD', 'CO1', 'COI', 'COX', 'DNA', 'mole', 'phylo', 'sequ', 'tree', 'bin', 'silva', 'ncbi', 'engine', 'blast', 'genbank', 'genetic', 'its']
-        df['ID_METHOD'] = df['identification_method'].apply(lambda x: 1 if any(p in str(x).lower() for p in pos) and not any(n in str(x).lower() for n in neg) else 0)
-    elif criterion == 'COLLECTORS':
-        df['COLLECTORS'] = df['collectors'].apply(lambda x: 1 if pd.notnull(x) else 0)
+        stats = df if 'seq_length' in df.columns else sequence_stats(df['nuc'])
+        return assess_sequence_quality(stats, seq_thresholds)
     elif criterion == 'COLLECTION_DATE':
-        df['COLLECTION_DATE'] = df.apply(lambda x: 1 if pd.notnull(x['collection_date_start']) or pd.notnull(x['collection_date_end']) else 0, axis=1)
-    elif criterion == 'COUNTRY':
-        df['COUNTRY'] = df['country/ocean'].apply(lambda x: 1 if pd.notnull(x) else 0)
-    elif criterion == 'SITE':
-        df['SITE'] = df['site'].apply(lambda x: 1 if pd.notnull(x) else 0)
-    elif criterion == 'COORD':
-        df['COORD'] = df['coord'].apply(lambda x: 1 if pd.notnull(x) else 0)
-    elif criterion == 'INSTITUTION':
-        neg = ['genbank', 'no voucher', 'personal', 'private', 'research collection of', 'unknown', 'unvouchered']
-        df['INSTITUTION'] = df['inst'].apply(lambda x: 0 if any(n in str(x).lower() for n in neg) or pd.isnull(x) else 1)
-    elif criterion == 'MUSEUM_ID':
-        df['MUSEUM_ID'] = df['museumid'].apply(lambda x: 1 if pd.notnull(x) else 0)
-
-    if 'record_id' not in df.columns:
-        logging.error("Column 'record_id' not found in the input file.")
-        raise KeyError("Column 'record_id' not found in the input file.")
-
-    df[['record_id', criterion]].to_csv(output_tsv, sep='\t', index=False)
+        return (df['collection_date_start'].notna() | df['collection_date_end'].notna()).astype(int)
+    elif criterion in ('COLLECTORS', 'COUNTRY', 'SITE', 'COORD', 'MUSEUM_ID'):
+        return df[CRITERION_COLUMNS[criterion][0]].notna().astype(int)
+    raise ValueError(f"Unknown criterion: {criterion}")
+
+def assess_shard(bold_data_tsv, criteria, keyword_rules, byte_range=None, seq_thresholds=THRESHOLDS, seq_stats=False):
+    """
+    Assesses the local criteria for the records in a byte range (or the whole file)
+    and returns the record_id and int8 criterion columns, followed by the nucleotide
+    statistics if seq_stats is set.
+    """
+    with instrumentation.phase('parse'):
+        df = read_bold_columns(bold_data_tsv, criteria, byte_range)
+    with instrumentation.phase('evaluate'):
+        if 'SEQ_QUALITY' in criteria:
+            df[STATS_COLUMNS] = sequence_stats(df['nuc'])
+        for criterion in criteria:
+            df[criterion] = assess_criterion(df, criterion, keyword_rules, seq_thresholds).astype(np.int8)
+    return df[['record_id'] + criteria + (STATS_COLUMNS if seq_stats else [])]
+
+def assess_chunks(bold_data_tsv, criteria, keyword_rules, ranges, workers=1, seq_thresholds=THRESHOLDS, seq_stats=False):
+    """
+    Yields the assessed chunks of the byte ranges in order. With several workers the chunks
+    are assessed in a process pool, with at most twice as many chunks as workers in flight.
+    """
+    if workers <= 1:
+        for byte_range in ranges:
+            yield assess_shard(bold_data_tsv, criteria, keyword_rules, byte_range, seq_thresholds, seq_stats)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for byte_range in ranges:
+            pending.append(executor.submit(assess_shard, bold_data_tsv, criteria, keyword_rules, byte_range, seq_thresholds, seq_stats))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def write_assessed(chunks, criteria, output_tsv=None, output_npy_dir=None, seq_stats_tsv=None):
+    """
+    Streams the assessed chunks to the output TSV file, or to one int8 array per criterion
+    in output_npy_dir, and their nucleotide statistics to seq_stats_tsv. Returns the number
+    of records.
+    """
+    rows = 0
+    with contextlib.ExitStack() as stack:
+        if output_npy_dir:
+            flags = {criterion: stack.enter_context(open(column_path(output_npy_dir, criterion) + '.part', 'wb')) for criterion in criteria}
+        else:
+            output = stack.enter_context(open(output_tsv, 'w', encoding='utf-8', newline=''))
+        stats = stack.enter_context(open(seq_stats_tsv, 'w', encoding='utf-8', newline='')) if seq_stats_tsv else None
+
+        for i, df in enumerate(chunks):
+            with instrumentation.phase('write'):
+                if stats:
+                    df[['record_id'] + STATS_COLUMNS].to_csv(stats, sep='\t', index=False, header=i == 0)
+                if output_npy_dir:
+                    for criterion in criteria:
+                        to_int8(df[criterion]).tofile(flags[criterion])
+                else:
+                    df[['record_id'] + criteria].to_csv(output, sep='\t', index=False, header=i == 0)
+            rows += len(df)
+
+    if output_npy_dir:
+        for criterion in criteria:
+            finish_column(column_path(output_npy_dir, criterion))
+    return rows
+
+def access_criteria(bold_data_tsv, criteria, output_tsv, image_url_flag, keyword_rules_tsv=KEYWORD_RULES_TSV, image_api_url=BASE_URL,
+                    image_cache=None, image_cache_ttl_days=0, output_npy_dir=None, shard=None, workers=1,
+                    seq_thresholds=THRESHOLDS, seq_stats_tsv=None, memory_mb=memory_budget.DEFAULT_MEMORY_MB):
+    """
+    Assesses one or more criteria for each record in the BOLD data. The input is
+    parsed once, restricted to the columns the criteria need, and all criterion
+    columns are written to a single output file, or to one int8 array per criterion
+    in output_npy_dir for the columnar backend. With a shard (index, count) only that
+    byte-range shard of the records is assessed. The records are assessed in byte-range
+    chunks that fit in the memory budget, and with several workers in a process pool;
+    the results are streamed to the output in record order. The nucleotide statistics
+    behind SEQ_QUALITY are written to seq_stats_tsv if given.
+    """
+    logging.info(f"Assessing criteria: {' '.join(criteria)}")
+
+    unknown = [criterion for criterion in criteria if criterion not in CRITERION_COLUMNS]
+    if unknown:
+        logging.error(f"Unknown criteria: {' '.join(unknown)}")
+        raise ValueError(f"Unknown criteria: {' '.join(unknown)}")
+
+    # HAS_IMAGE is network-bound and is kept out of the fused local pass
+    if 'HAS_IMAGE' in criteria and len(criteria) > 1:
+        logging.error("HAS_IMAGE must be assessed on its own.")
+        raise ValueError("HAS_IMAGE must be assessed on its own.")
+    if criteria == ['HAS_IMAGE'] and shard:
+        logging.error("HAS_IMAGE is not assessed in shards.")
+        raise ValueError("HAS_IMAGE is not assessed in shards.")
+    if seq_stats_tsv and 'SEQ_QUALITY' not in criteria:
+        logging.error("Nucleotide statistics are only computed with SEQ_QUALITY.")
+        raise ValueError("Nucleotide statistics are only computed with SEQ_QUALITY.")
+
+    keyword_rules = load_keyword_rules(keyword_rules_tsv)
+    for criterion in criteria:
+        if criterion in keyword_rules and keyword_rules[criterion]['column'] not in CRITERION_COLUMNS[criterion]:
+            raise ValueError(f"Keyword rules for {criterion} read a column the criterion does not load.")
+
+    if criteria == ['HAS_IMAGE']:
+        # Streams the input and the results; the full table is never loaded
+        image_url_tsv = os.path.join(output_npy_dir or os.path.dirname(output_tsv), "image_urls.tsv")
+        output_npy = column_path(output_npy_dir, 'HAS_IMAGE') if output_npy_dir else None
+        cache = ImageCache(image_cache, image_cache_ttl_days) if image_cache else None
+        try:
+            if cache:
+                cache.evict_expired()
+            asyncio.run(assess_has_image(bold_data_tsv, output_tsv, image_url_flag, image_url_tsv, image_api_url, cache, output_npy))
+        finally:
+            if cache:
+                cache.close()
+        instrumentation.add_file('bytes_read', bold_data_tsv)
+        instrumentation.add_file('bytes_written', output_npy or output_tsv)
+        instrumentation.add_file('bytes_written', image_url_tsv if image_url_flag else None)
+        return
+
+    # Each worker parses one chunk at a time
+    chunk_bytes = memory_budget.chunk_bytes(memory_mb, memory_budget.PROJECTED_EXPANSION, chunks=workers)
+    if shard:
+        index, count = shard
+        start, end = shard_ranges(bold_data_tsv, count)[index]
+        ranges = chunk_ranges(bold_data_tsv, chunk_bytes, (start, end), min_count=workers)
+        instrumentation.add('bytes_read', end - start)
+    else:
+        ranges = chunk_ranges(bold_data_tsv, chunk_bytes, min_count=workers)
+        instrumentation.add_file('bytes_read', bold_data_tsv)
+    logging.info(f"Assessing {len(ranges)} chunks of up to {chunk_bytes // 2**20} MB with {workers} workers")
+
+    chunks = assess_chunks(bold_data_tsv, criteria, keyword_rules, ranges, workers, seq_thresholds, bool(seq_stats_tsv))
+    if workers > 1:
+        # Parsing and evaluation happen in the workers and are timed together
+        chunks = instrumentation.timed(chunks, 'shards')
+    rows = write_assessed(chunks, criteria, output_tsv, output_npy_dir, seq_stats_tsv)
+    instrumentation.add('rows', rows)
+
+    for path in [seq_stats_tsv] + ([column_path(output_npy_dir, criterion) for criterion in criteria] if output_npy_dir else [output_tsv]):
+        instrumentation.add_file('bytes_written', path)
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Assess a specified criterion for each record in the BOLD data.")
+    parser = argparse.ArgumentParser(description="Assess one or more criteria for each record in the BOLD data.")
     parser.add_argument('--bold_data_tsv', required=True, help="Path to the input BOLD data TSV file.")
-    parser.add_argument('--criterion', required=True, help="The criterion to be assessed.")
-    parser.add_argument('--output_tsv', required=True, help="Path to the output TSV file containing the assessed criterion.")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--criterion', help="The criterion to be assessed.")
+    group.add_argument('--criteria', help="String of criteria separated by spaces, assessed in a single pass.")
+    output_group = parser.add_mutually_exclusive_group(required=True)
+    output_group.add_argument('--output_tsv', help="Path to the output TSV file containing the assessed criteria.")
+    output_group.add_argument('--output_npy_dir', help="Directory for one int8 array per criterion (columnar backend).")
     parser.add_argument('--image_url', required=False, default=False, action='store_true', help="Flag to specify whether the image_url file should be generated.")
+    parser.add_argument('--image_api_url', required=False, default=BASE_URL, help="URL of the images API used for HAS_IMAGE (e.g. a local mock server).")
+    parser.add_argument('--image_cache', required=False, help="Path to the SQLite cache of HAS_IMAGE lookups; no cache is used if omitted.")
+    parser.add_argument('--image_cache_ttl_days', required=False, type=float, default=0, help="Days a cached HAS_IMAGE lookup stays valid (0 keeps entries forever).")
+    parser.add_argument('--keyword_rules', required=False, default=KEYWORD_RULES_TSV, help="Path to the keyword rules TSV file for the text criteria.")
+    parser.add_argument('--shard', required=False, type=parse_shard, help="Assess only one byte-range shard of the records, given as INDEX/COUNT (e.g. 0/8).")
+    parser.add_argument('--workers', required=False, type=int, default=1, help="Number of processes assessing shards of the local criteria.")
+    parser.add_argument('--seq_min_length', type=int, default=THRESHOLDS['min_length'], help="SEQ_QUALITY: sequences must be longer than this many bases (gaps excluded).")
+    parser.add_argument('--seq_max_ambiguity', type=float, default=THRESHOLDS['max_ambiguity'], help="SEQ_QUALITY: maximum fraction of ambiguous bases (N and other IUPAC codes).")
+    parser.add_argument('--seq_max_gap_runs', type=int, default=THRESHOLDS['max_gap_runs'], help="SEQ_QUALITY: maximum number of internal gap runs (no limit if omitted).")
+    parser.add_argument('--seq_stats_tsv', required=False, help="Path to the output TSV file with the nucleotide statistics of every record (requires SEQ_QUALITY).")
+    memory_budget.add_arguments(parser)
+    parser.add_argument('--log_file', required=False, help="Path to the log file.")
+    instrumentation.add_arguments(parser)
     args = parser.parse_args()
 
-    access_criteria(args.bold_data_tsv, args.criterion, args.output_tsv, args.image_url)
\ No newline at end of file
+    logging.basicConfig(filename=args.log_file, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    criteria = [args.criterion] if args.criterion else args.criteria.split()
+    instrumentation.start('access_criteria ' + ' '.join(criteria), args.metrics_json, args.profile)
+    access_criteria(args.bold_data_tsv, criteria, args.output_tsv, args.image_url, args.keyword_rules, args.image_api_url,
+                    args.image_cache, args.image_cache_ttl_days, args.output_npy_dir, args.shard, args.workers,
+                    {'min_length': args.seq_min_length, 'max_ambiguity': args.seq_max_ambiguity, 'max_gap_runs': args.seq_max_gap_runs},
+                    args.seq_stats_tsv, args.memory_mb)
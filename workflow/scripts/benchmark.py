@@ -0,0 +1,234 @@
+"""
+Script: benchmark.py
+Description: This script benchmarks the pipeline stage by stage on a synthetic BCDM snapshot.
+             Every stage is run as its own process with the same arguments as in the Snakefile,
+             and its wall-clock time, records per second, peak memory (RSS) and time per phase
+             (from the stage's metrics JSON) are recorded.
+             HAS_IMAGE is assessed against a local mock of the images API. The results are
+             written as JSON, and can be compared to the results of an earlier run.
+Input:
+    - rows / seed: Size and seed of the generated snapshot (or bold_data_tsv for an existing file).
+    - workdir: Directory the stages run in (results/ and logs/ are created there).
+    - compare: Path to the JSON results of an earlier run.
+Output:
+    - output_json: Path to the JSON file with the results per stage.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import platform
+import argparse
+import subprocess
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+RESOURCES_DIR = os.path.join(SCRIPTS_DIR, '..', '..', 'resources')
+
+SEED = 42
+
+CRITERIA = ['SPECIES_ID', 'TYPE_SPECIMEN', 'SEQ_QUALITY', 'PUBLIC_VOUCHER', 'HAS_IMAGE', 'IDENTIFIER', 'ID_METHOD',
+            'COLLECTORS', 'COLLECTION_DATE', 'COUNTRY', 'SITE', 'COORD', 'INSTITUTION', 'MUSEUM_ID']
+
+def script(name):
+    """
+    Returns the command prefix that runs a pipeline script.
+    """
+    return [sys.executable, os.path.join(SCRIPTS_DIR, name)]
+
+def pipeline_stages(bold_data_tsv, criteria, columnar, workers, image_api_url):
+    """
+    Returns the (name, command) of every stage, in pipeline order, as run by the Snakefile.
+    """
+    local = [criterion for criterion in criteria if criterion != 'HAS_IMAGE']
+    if columnar:
+        local_output = ['--output_npy_dir', 'results']
+        has_image_output = ['--output_npy_dir', 'results']
+        accessed = [f"results/accessed_{criterion}.npy" for criterion in criteria]
+        concatenated = 'results/concatenated.json'
+    else:
+        local_output = ['--output_tsv', 'results/accessed_LOCAL.tsv']
+        has_image_output = ['--output_tsv', 'results/accessed_HAS_IMAGE.tsv']
+        accessed = ['results/accessed_LOCAL.tsv'] + (['results/accessed_HAS_IMAGE.tsv'] if 'HAS_IMAGE' in criteria else [])
+        concatenated = 'results/concatenated.tsv'
+
+    stages = [
+        ('load_criteria', script('load_criteria.py') + ['--bold_data_tsv', bold_data_tsv, '--output_tsv', 'results/bold_with_criteria.tsv',
+                                                        '--quarantine_tsv', 'results/quarantine.tsv']),
+        ('fingerprint', script('incremental.py') + ['fingerprint', '--bold_data_tsv', 'results/bold_with_criteria.tsv',
+                                                    '--criteria', ' '.join(criteria), '--fingerprints_tsv', 'results/fingerprints.tsv',
+                                                    '--digest_txt', 'results/criteria_digest.txt']),
+        ('access_local_criteria', script('access_criteria.py') + ['--bold_data_tsv', 'results/bold_with_criteria.tsv', '--criteria', ' '.join(local),
+                                                                  '--workers', str(workers)] + local_output),
+    ]
+    if 'HAS_IMAGE' in criteria:
+        stages.append(('access_has_image', script('access_criteria.py') + ['--bold_data_tsv', 'results/bold_with_criteria.tsv', '--criterion', 'HAS_IMAGE',
+                                                                           '--image_api_url', image_api_url] + has_image_output))
+    stages += [
+        ('concatenate', script('concat.py') + ['--criteria', ' '.join(criteria), '--input_tsvs'] + accessed + ['--output_path', concatenated]),
+        ('ranking_score', script('ranking_score.py') + ['--db_file', concatenated, '--criteria_file', 'results/bold_with_criteria.tsv',
+                                                        '--output_path', 'results/result_output.tsv', '--workers', str(workers)]),
+        ('filter_output', script('filter_tsv.py') + ['results/result_output.tsv', 'results/result_output_filtered.tsv', '--workers', str(workers)]),
+    ]
+    return stages
+
+def run_stage(command, workdir):
+    """
+    Runs a stage and returns its wall-clock time in seconds and peak RSS in MB.
+    The peak RSS covers the stage process and the worker processes it waited for. Linux
+    carries the peak RSS over from the parent when a process starts, so this process does
+    not import pandas or generate data itself.
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=workdir)
+    _, status, usage = os.wait4(process.pid, 0)
+    seconds = time.perf_counter() - start
+    process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command)
+    return seconds, usage.ru_maxrss / 1024
+
+def free_port():
+    """
+    Returns a free local TCP port.
+    """
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def start_mock_api(port, image_rate, latency, failure_rate, timeout=30):
+    """
+    Starts the mock images API and waits until it accepts connections.
+    """
+    process = subprocess.Popen(script('mock_image_api.py') + ['--port', str(port), '--image_rate', str(image_rate),
+                                                              '--latency', str(latency), '--failure_rate', str(failure_rate)],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f"The mock images API did not start on port {port}.")
+
+def count_records(tsv):
+    """
+    Returns the number of records in a TSV file with a header line.
+    """
+    with open(tsv, 'rb') as f:
+        return max(0, sum(block.count(b'\n') for block in iter(lambda: f.read(1 << 20), b'')) - 1)
+
+def git_commit():
+    """
+    Returns the current git commit of the repository, if available.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=SCRIPTS_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare_results(results, previous, max_slowdown):
+    """
+    Prints the time of every stage relative to an earlier run. Returns the stages that
+    are more than max_slowdown times slower.
+    """
+    regressions = []
+    for stage, current in results['stages'].items():
+        if stage not in previous['stages']:
+            continue
+        ratio = current['seconds'] / max(previous['stages'][stage]['seconds'], 1e-9)
+        print(f"{stage}: {previous['stages'][stage]['seconds']:.2f}s -> {current['seconds']:.2f}s ({ratio:.2f}x)")
+        if ratio > max_slowdown:
+            regressions.append(stage)
+    return regressions
+
+def benchmark(workdir, rows, seed=SEED, bold_data_tsv=None, criteria=CRITERIA, columnar=False, workers=1,
+              image_rate=0.5, latency=0.0, failure_rate=0.0):
+    """
+    Runs every stage of the pipeline once and returns the results per stage.
+    """
+    for directory in ('results', 'logs'):
+        os.makedirs(os.path.join(workdir, directory), exist_ok=True)
+    if not os.path.exists(os.path.join(workdir, 'resources')):
+        os.symlink(os.path.abspath(RESOURCES_DIR), os.path.join(workdir, 'resources'))
+
+    results = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'seed': seed,
+        'format': 'npy' if columnar else 'tsv',
+        'workers': workers,
+        'criteria': criteria,
+        'stages': {},
+    }
+
+    if bold_data_tsv is None:
+        bold_data_tsv = os.path.join(workdir, f"bcdm_{rows}_{seed}.tsv")
+        if not os.path.exists(bold_data_tsv):
+            start = time.perf_counter()
+            subprocess.run(script('generate_bcdm.py') + ['--rows', str(rows), '--output_tsv', bold_data_tsv, '--seed', str(seed)], check=True)
+            print(f"Generated {rows} records in {time.perf_counter() - start:.1f}s: {bold_data_tsv}")
+    bold_data_tsv = os.path.abspath(bold_data_tsv)
+    results['input'] = bold_data_tsv
+    results['input_bytes'] = os.path.getsize(bold_data_tsv)
+    results['rows'] = count_records(bold_data_tsv)
+
+    mock = None
+    port = free_port()
+    if 'HAS_IMAGE' in criteria:
+        mock = start_mock_api(port, image_rate, latency, failure_rate)
+    try:
+        for stage, command in pipeline_stages(bold_data_tsv, criteria, columnar, workers, f"http://127.0.0.1:{port}/api/images?processids="):
+            metrics_json = os.path.join(workdir, 'logs', f"{stage}.metrics.json")
+            seconds, peak_rss_mb = run_stage(command + ['--log_file', f"logs/{stage}.log", '--metrics_json', f"logs/{stage}.metrics.json"], workdir)
+            with open(metrics_json) as f:
+                metrics = json.load(f)
+            results['stages'][stage] = {
+                'seconds': round(seconds, 3),
+                'rows_per_sec': round(results['rows'] / seconds, 1) if seconds > 0 else None,
+                'peak_rss_mb': round(peak_rss_mb, 1),
+                'phases': metrics['phases'],
+            }
+            print(f"{stage}: {seconds:.2f}s, {results['stages'][stage]['rows_per_sec']} rows/s, {peak_rss_mb:.0f} MB")
+    finally:
+        if mock:
+            mock.terminate()
+            mock.wait()
+
+    results['total_seconds'] = round(sum(stage['seconds'] for stage in results['stages'].values()), 3)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark every stage of the pipeline on a synthetic BCDM snapshot.")
+    parser.add_argument('--rows', type=int, default=10000, help="Number of records to generate (e.g. 10000, 1000000, 10000000).")
+    parser.add_argument('--seed', type=int, default=SEED, help="Random seed of the generated snapshot.")
+    parser.add_argument('--bold_data_tsv', required=False, help="Benchmark an existing BCDM TSV file instead of generating one.")
+    parser.add_argument('--workdir', default='benchmark', help="Directory the stages run in.")
+    parser.add_argument('--criteria', default=' '.join(CRITERIA), help="String of criteria separated by spaces.")
+    parser.add_argument('--columnar', action='store_true', help="Use the columnar (.npy) backend for the criterion intermediates.")
+    parser.add_argument('--workers', type=int, default=1, help="Worker processes for the stages that support them.")
+    parser.add_argument('--image_rate', type=float, default=0.5, help="Fraction of records the mock images API reports an image for.")
+    parser.add_argument('--latency', type=float, default=0.0, help="Delay in seconds the mock images API adds to every response.")
+    parser.add_argument('--failure_rate', type=float, default=0.0, help="Fraction of requests the mock images API answers with HTTP 503.")
+    parser.add_argument('--output_json', required=True, help="Path to the output JSON file.")
+    parser.add_argument('--compare', required=False, help="Path to the JSON results of an earlier run to compare against.")
+    parser.add_argument('--max_slowdown', type=float, default=1.25, help="Exit with an error if a stage is this many times slower than in --compare.")
+    args = parser.parse_args()
+
+    results = benchmark(args.workdir, args.rows, args.seed, args.bold_data_tsv, args.criteria.split(), args.columnar, args.workers,
+                        args.image_rate, args.latency, args.failure_rate)
+    with open(args.output_json, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_results(results, json.load(f), args.max_slowdown)
+        if regressions:
+            print(f"Slower than {args.max_slowdown}x the earlier run: {' '.join(regressions)}")
+            sys.exit(1)
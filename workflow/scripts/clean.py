@@ -7,14 +7,16 @@ Output: None (removes files from the 'results' directory)
 
 import os
 import glob
+import shutil
 
 def clean_results():
     """
     Removes intermediate files from the 'results' directory.
     """
-    for file_pattern in ["results/*.tsv", "results/*.ok", "results/*.db"]:
+    for file_pattern in ["results/*.tsv", "results/*.ok", "results/*.db", "results/*.npy", "results/*.json", "results/*.txt"]:
         for file_path in glob.glob(file_pattern):
             os.remove(file_path)
+    shutil.rmtree("results/shards", ignore_errors=True)
 
 if __name__ == "__main__":
     clean_results()
\ No newline at end of file
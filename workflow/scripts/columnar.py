@@ -0,0 +1,73 @@
+"""
+Script: columnar.py
+Description: This module implements the columnar backend for the intermediate criterion
+             outputs. Each criterion is stored as a 1-byte NumPy array aligned by row position
+             with the assessed BOLD data (1 = met, 0 = not met, -1 = unknown). Concatenating
+             criteria only writes a small JSON manifest that refers to these arrays, and
+             downstream stages memory-map the columns they need.
+Input:
+    - column arrays: results/accessed_{criterion}.npy
+Output:
+    - manifest: JSON file with the number of rows and the array file of each criterion.
+"""
+
+import os
+import json
+import numpy as np
+
+UNKNOWN = -1
+
+def column_path(directory, criterion):
+    """
+    Returns the path of the array file for a criterion.
+    """
+    return os.path.join(directory, f"accessed_{criterion}.npy")
+
+def to_int8(values):
+    """
+    Converts criterion values to int8; missing values are stored as UNKNOWN.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    return np.where(np.isnan(values), UNKNOWN, values).astype(np.int8)
+
+def finish_column(path):
+    """
+    Turns the raw int8 values streamed to path + '.part' into the criterion column at path.
+    """
+    np.save(path, np.fromfile(path + '.part', dtype=np.int8))
+    os.remove(path + '.part')
+
+def open_column(path):
+    """
+    Memory-maps a criterion column.
+    """
+    return np.load(path, mmap_mode='r')
+
+def write_manifest(column_paths, manifest_path):
+    """
+    Assembles criterion columns into a manifest without copying them. All columns
+    must have the same number of rows.
+    """
+    columns = {}
+    rows = None
+    for path in column_paths:
+        criterion = os.path.basename(path)[len('accessed_'):-len('.npy')]
+        length = len(open_column(path))
+        if rows is None:
+            rows = length
+        elif length != rows:
+            raise ValueError(f"Column {criterion} has {length} rows, expected {rows}.")
+        columns[criterion] = os.path.relpath(path, os.path.dirname(os.path.abspath(manifest_path)))
+
+    with open(manifest_path, 'w') as f:
+        json.dump({'rows': rows or 0, 'columns': columns}, f, indent=2)
+
+def open_manifest(manifest_path):
+    """
+    Returns the number of rows and the memory-mapped columns of a manifest.
+    """
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    directory = os.path.dirname(os.path.abspath(manifest_path))
+    columns = {criterion: open_column(os.path.join(directory, path)) for criterion, path in manifest['columns'].items()}
+    return manifest['rows'], columns
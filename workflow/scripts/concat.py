@@ -1,34 +1,90 @@
 """
 Script: concat.py
-Description: This script concatenates multiple TSV files into a single TSV file.
+Description: This script concatenates multiple TSV files into a single TSV file. With the
+             columnar backend (.npy inputs) it writes a JSON manifest of the criterion
+             arrays instead, without copying them.
 Input: 
     - criteria: List of criteria to determine the input TSV files.
-    - output_path: Path to the output concatenated TSV file.
+    - input_tsvs: Explicit list of input TSV (or .npy) files (e.g. the output of the fused criteria rule).
+    - output_path: Path to the output concatenated TSV file (or JSON manifest).
+    - memory_mb: Memory budget; the TSV files are concatenated in chunks of rows that fit in it.
 Output: 
-    - output_path: Concatenated TSV file.
+    - output_path: Concatenated TSV file, or JSON manifest for the columnar backend.
 """
 
 import pandas as pd
 import argparse
+import logging
+from itertools import zip_longest
+import instrumentation
+import memory_budget
+from columnar import write_manifest
 
-def concatenate_tsvs(file_paths, output_path):
+def read_chunks(file_path, criteria, chunk_size):
     """
-    Concatenates multiple TSV files into a single TSV file.
+    Streams a TSV file in chunks of rows, with the criterion columns as nullable int8
+    and all other columns as text.
     """
-    dfs = [pd.read_csv(file_path, sep='\t') for file_path in file_paths]
-    concatenated_df = pd.concat(dfs, axis=1)
-    
-    # Remove duplicate columns, keeping the first occurrence
-    concatenated_df = concatenated_df.loc[:, ~concatenated_df.columns.duplicated()]
-    
-    concatenated_df.to_csv(output_path, sep='\t', index=False)
+    columns = pd.read_csv(file_path, sep='\t', nrows=0).columns
+    dtypes = {column: 'Int8' if column in criteria else str for column in columns}
+    return pd.read_csv(file_path, sep='\t', dtype=dtypes, chunksize=chunk_size)
+
+def concatenate_tsvs(file_paths, output_path, criteria=None, memory_mb=memory_budget.DEFAULT_MEMORY_MB):
+    """
+    Concatenates multiple TSV files into a single TSV file. If criteria are given,
+    the criterion columns are put in that order. The files are read side by side in
+    chunks of rows that fit in the memory budget.
+    """
+    criteria = criteria or []
+    chunk_size = memory_budget.chunk_rows(file_paths[0], memory_mb, memory_budget.PROJECTED_EXPANSION, chunks=len(file_paths))
+    readers = [read_chunks(file_path, criteria, chunk_size) for file_path in file_paths]
+
+    rows = 0
+    for i, dfs in enumerate(instrumentation.timed(zip_longest(*readers), 'parse')):
+        with instrumentation.phase('join'):
+            if any(df is None for df in dfs) or len({len(df) for df in dfs}) > 1:
+                logging.error(f"The input files do not have the same number of records: {' '.join(file_paths)}")
+                raise ValueError("The input files do not have the same number of records.")
+            concatenated_df = pd.concat(dfs, axis=1)
+
+            # Remove duplicate columns, keeping the first occurrence
+            concatenated_df = concatenated_df.loc[:, ~concatenated_df.columns.duplicated()]
+
+            if criteria:
+                ordered = [column for column in criteria if column in concatenated_df.columns]
+                rest = [column for column in concatenated_df.columns if column not in ordered]
+                concatenated_df = concatenated_df[rest + ordered]
+
+        with instrumentation.phase('write'):
+            concatenated_df.to_csv(output_path, sep='\t', index=False, mode='w' if i == 0 else 'a', header=i == 0)
+        rows += len(concatenated_df)
+    instrumentation.add('rows', rows)
+    logging.info(f"Concatenated {len(file_paths)} files with {rows} records into {output_path}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Concatenate multiple TSV files into a single TSV file.")
     parser.add_argument('--criteria', required=True, help="Criteria to determine the input TSV files.")
+    parser.add_argument('--input_tsvs', nargs='+', required=False, help="Input TSV files; defaults to one file per criterion.")
     parser.add_argument('--output_path', required=True, help="Path to the output concatenated TSV file.")
+    memory_budget.add_arguments(parser)
+    parser.add_argument('--log_file', required=False, help="Path to the log file.")
+    instrumentation.add_arguments(parser)
     args = parser.parse_args()
 
+    logging.basicConfig(filename=args.log_file, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    instrumentation.start('concatenate', args.metrics_json, args.profile)
+
     criteria = args.criteria.split()
-    file_paths = [f"results/accessed_{criterion}.tsv" for criterion in criteria]
-    concatenate_tsvs(file_paths, args.output_path)
\ No newline at end of file
+    if args.input_tsvs:
+        file_paths = args.input_tsvs
+    else:
+        file_paths = [f"results/accessed_{criterion}.tsv" for criterion in criteria]
+
+    if all(file_path.endswith('.npy') for file_path in file_paths):
+        with instrumentation.phase('write'):
+            write_manifest(file_paths, args.output_path)
+    else:
+        concatenate_tsvs(file_paths, args.output_path, criteria, args.memory_mb)
+        for file_path in file_paths:
+            instrumentation.add_file('bytes_read', file_path)
+    instrumentation.add_file('bytes_written', args.output_path)
\ No newline at end of file
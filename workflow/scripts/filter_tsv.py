@@ -1,60 +1,230 @@
+"""
+Script: filter_tsv.py
+Description: This script keeps the best-ranked record(s) of every BIN (or species) in the ranked
+             output. Records without a ranking are skipped; records of rank 0 (no tier met) sort
+             after all ranked records. The input is scanned once, in byte
+             ranges split across worker processes, keeping only the sort key and byte offset of
+             the best records per group; the winners are then read back by seeking to their
+             offsets. The criterion and ranking columns are dropped by name.
+Input:
+    - input_file: Path to the ranked TSV file (result_output.tsv).
+    - group_by: Column to group records by (bin_uri or species).
+    - top_k: Number of records to keep per group.
+    - tie_break: 'first' keeps the earliest record among equal rankings; a column name breaks
+                 ties by the smallest value of that column (compared as numbers where the values
+                 are numbers; records with an empty value come last).
+    - previous_filtered / affected_bins: Previous filtered output and the bin_uris to re-select
+                                         (incremental mode).
+Output:
+    - output_file: Path to the filtered TSV file.
+"""
+
+import os
 import csv
+import math
+import bisect
 import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor
+import instrumentation
 
-def filter_tsv(input_file, temp_file):
-    with open(input_file, 'r', encoding='utf-8') as infile, open(temp_file, 'w', encoding='utf-8', newline='') as outfile:
-        reader = csv.DictReader(infile, delimiter='\t')
-        fieldnames = reader.fieldnames
-        writer = csv.DictWriter(outfile, fieldnames=fieldnames, delimiter='\t')
-        
-        writer.writeheader()
-        for row in reader:
-            if row['ranking']:  # Check if the ranking field is not empty
-                # Ensure the row contains only the expected fieldnames
-                filtered_row = {key: row[key] for key in fieldnames}
-                writer.writerow(filtered_row)
-
-def filter_by_bin_uri(temp_file, output_file):
-    records = {}
-    total_records = 0
-    removed_records = 0
-    
-    # Read the temp file and group records by bin_uri
-    with open(temp_file, 'r', encoding='utf-8') as infile:
-        reader = csv.DictReader(infile, delimiter='\t')
-        for row in reader:
-            total_records += 1
-            bin_uri = row['bin_uri']
-            ranking = int(row['ranking']) if row['ranking'] else float('inf')
-            
-            if bin_uri not in records:
-                records[bin_uri] = row
+CRITERIA_TSV = 'resources/criteria.tsv'
+
+# Rank of records that meet no tier; it sorts after every tier
+UNRANKED = 0
+
+def read_criteria_names(criteria_tsv):
+    """
+    Returns the names of all criteria defined in the criteria TSV file.
+    """
+    with open(criteria_tsv, 'r', encoding='utf-8') as infile:
+        return [row[1] for row in csv.reader(infile, delimiter='\t') if len(row) > 1]
+
+def read_header(input_file):
+    """
+    Returns the column names and the byte offset of the first record.
+    """
+    with open(input_file, 'rb') as infile:
+        header_line = infile.readline()
+    return next(csv.reader([header_line.decode('utf-8')], delimiter='\t')), len(header_line)
+
+def split_ranges(input_file, start, workers):
+    """
+    Splits the records of the file into up to `workers` byte ranges aligned to line starts.
+    """
+    size = os.path.getsize(input_file)
+    boundaries = [start]
+    with open(input_file, 'rb') as infile:
+        for i in range(1, workers):
+            infile.seek(max(start, size * i // workers))
+            infile.readline()
+            boundaries.append(max(boundaries[-1], min(infile.tell(), size)))
+    boundaries.append(size)
+    return [(boundaries[i], boundaries[i + 1]) for i in range(len(boundaries) - 1) if boundaries[i] < boundaries[i + 1]]
+
+def rank_key(ranking):
+    """
+    Returns the sort key of a ranking: tiers in order, then unranked records.
+    """
+    rank = int(ranking)
+    return math.inf if rank == UNRANKED else rank
+
+def tie_key(value):
+    """
+    Returns the sort key of a tie-break value: numbers in numeric order, then other text,
+    then empty values.
+    """
+    if not value:
+        return (2, 0, '')
+    try:
+        number = float(value)
+    except ValueError:
+        return (1, 0, value)
+    if math.isfinite(number):
+        return (0, number, '')
+    return (1, 0, value)
+
+def keep_best(candidates, key, top_k):
+    """
+    Inserts a (sort key, offset) into a sorted candidate list and keeps the best top_k.
+    """
+    if len(candidates) < top_k or key < candidates[-1]:
+        bisect.insort(candidates, key)
+        del candidates[top_k:]
+
+def scan_range(input_file, start, end, fields, top_k, tie_break, previous_winners, affected_bins):
+    """
+    Scans a byte range and returns the number of ranked records and, per group, the offset
+    of its first ranked record and its best (sort key, offset) candidates.
+    """
+    group_index, ranking_index, record_id_index, tie_index = fields
+    groups = {}
+    total = 0
+    with open(input_file, 'rb') as infile:
+        infile.seek(start)
+        offset = start
+        while offset < end:
+            line = infile.readline()
+            if not line:
+                break
+            values = line.rstrip(b'\r\n').decode('utf-8').split('\t')
+            line_offset = offset
+            offset += len(line)
+
+            ranking = values[ranking_index]
+            if not ranking:
+                continue
+            total += 1
+            group = values[group_index]
+
+            if group not in groups:
+                groups[group] = [line_offset, []]
+
+            # Groups unaffected since the previous run only consider their previous winners
+            if previous_winners is not None and group not in affected_bins and group in previous_winners:
+                if values[record_id_index] not in previous_winners[group]:
+                    continue
+
+            if tie_index is None:
+                key = (rank_key(ranking), line_offset)
             else:
-                current_ranking = int(records[bin_uri]['ranking']) if records[bin_uri]['ranking'] else float('inf')
-                if ranking < current_ranking:
-                    records[bin_uri] = row
-    
-    # Calculate the number of removed records
-    removed_records = total_records - len(records)
-    
-    # Write the filtered records to the output file
-    with open(output_file, 'w', encoding='utf-8', newline='') as outfile:
-        fieldnames = reader.fieldnames[:-15]  # Remove the last 15 columns
-        writer = csv.DictWriter(outfile, fieldnames=fieldnames, delimiter='\t')
-        writer.writeheader()
-        for record in records.values():
-            filtered_record = {key: (record[key] if record[key] and record[key] != 'None' else '') for key in fieldnames}
-            writer.writerow(filtered_record)
-    
-    print(f'Total records: {total_records}')
-    print(f'Removed records: {removed_records}')
+                key = (rank_key(ranking), tie_key(values[tie_index]), line_offset)
+            keep_best(groups[group][1], key, top_k)
+    return total, groups
+
+def read_previous_winners(previous_filtered, affected_bins_file):
+    """
+    Returns the affected bin_uris and the previous run's winning record_ids of every
+    bin_uri, for incremental runs that only redo the selection in affected bins.
+    """
+    with open(affected_bins_file, 'r', encoding='utf-8') as infile:
+        affected_bins = {line.rstrip('\n') for line in infile if line.strip()}
+    previous_winners = {}
+    with open(previous_filtered, 'r', encoding='utf-8') as infile:
+        for row in csv.DictReader(infile, delimiter='\t'):
+            previous_winners.setdefault(row['bin_uri'], set()).add(row['record_id'])
+    return affected_bins, previous_winners
+
+def filter_by_group(input_file, output_file, drop_columns, group_by='bin_uri', top_k=1, tie_break='first', workers=1,
+                    affected_bins=None, previous_winners=None):
+    """
+    Writes the best top_k ranked records of every group, in order of each group's first
+    ranked record, with the dropped columns removed.
+    """
+    fieldnames, data_start = read_header(input_file)
+    for column in [group_by, 'ranking', 'record_id'] + ([] if tie_break == 'first' else [tie_break]):
+        if column not in fieldnames:
+            raise KeyError(f"Column '{column}' not found in {input_file}")
+    fields = (fieldnames.index(group_by), fieldnames.index('ranking'), fieldnames.index('record_id'),
+              None if tie_break == 'first' else fieldnames.index(tie_break))
+
+    ranges = split_ranges(input_file, data_start, workers)
+    args = [(input_file, start, end, fields, top_k, tie_break, previous_winners, affected_bins) for start, end in ranges]
+    with instrumentation.phase('scan'):
+        if workers > 1 and len(ranges) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                partials = list(executor.map(scan_range, *zip(*args)))
+        else:
+            partials = [scan_range(*arg) for arg in args]
+
+    # Combine the partial results of the byte ranges
+    total_records = 0
+    groups = {}
+    with instrumentation.phase('join'):
+        for total, partial in partials:
+            total_records += total
+            for group, (first_offset, candidates) in partial.items():
+                if group not in groups:
+                    groups[group] = [first_offset, []]
+                else:
+                    groups[group][0] = min(groups[group][0], first_offset)
+                for key in candidates:
+                    keep_best(groups[group][1], key, top_k)
+
+    # Read the winners back by seeking to their offsets
+    kept_columns = [i for i, name in enumerate(fieldnames) if name not in drop_columns]
+    written = 0
+    with instrumentation.phase('write'), open(input_file, 'rb') as infile, open(output_file, 'w', encoding='utf-8', newline='') as outfile:
+        writer = csv.writer(outfile, delimiter='\t')
+        writer.writerow([fieldnames[i] for i in kept_columns])
+        for first_offset, candidates in sorted(groups.values(), key=lambda g: g[0]):
+            for key in candidates:
+                infile.seek(key[-1])
+                row = next(csv.reader([infile.readline().decode('utf-8')], delimiter='\t'))
+                writer.writerow([row[i] if row[i] and row[i] != 'None' else '' for i in kept_columns])
+                written += 1
+
+    instrumentation.add('rows', total_records)
+    instrumentation.add('removed_records', total_records - written)
+    instrumentation.add_file('bytes_read', input_file)
+    instrumentation.add_file('bytes_written', output_file)
+    logging.info(f'Total records: {total_records}')
+    logging.info(f'Removed records: {total_records - written}')
 
 if __name__ == '__main__':
-    parser = argparse.ArgumentParser(description='Filter TSV file to remove rows with empty ranking field and keep only one record with the lowest ranking score for each unique bin_uri.')
+    parser = argparse.ArgumentParser(description='Filter TSV file to remove rows with empty ranking field and keep only the records with the lowest ranking score (rank 0 last) for each unique bin_uri (or species).')
     parser.add_argument('input_file', help='Path to the input TSV file')
     parser.add_argument('output_file', help='Path to the output TSV file')
+    parser.add_argument('--group_by', default='bin_uri', help='Column to group records by, e.g. bin_uri or species')
+    parser.add_argument('--top_k', type=int, default=1, help='Number of records to keep per group')
+    parser.add_argument('--tie_break', default='first', help="'first' to keep the earliest record among equal rankings, or a column name to prefer its smallest value (numbers compared numerically, empty values last)")
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker processes scanning the input')
+    parser.add_argument('--criteria_tsv', default=CRITERIA_TSV, help='Path to the criteria TSV file; these columns and ranking are dropped from the output')
+    parser.add_argument('--previous_filtered', help='Path to the filtered output of the previous run (incremental mode)')
+    parser.add_argument('--affected_bins', help='Path to the file listing the bin_uris to re-select (incremental mode)')
+    parser.add_argument('--log_file', help='Path to the log file')
+    instrumentation.add_arguments(parser)
     args = parser.parse_args()
-    
-    temp_file = 'temp_filtered.tsv'
-    filter_tsv(args.input_file, temp_file)
-    filter_by_bin_uri(temp_file, args.output_file)
\ No newline at end of file
+
+    logging.basicConfig(filename=args.log_file, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    instrumentation.start('filter_output', args.metrics_json, args.profile)
+
+    affected_bins, previous_winners = None, None
+    if args.previous_filtered and args.affected_bins:
+        if args.group_by != 'bin_uri':
+            parser.error('Incremental mode requires --group_by bin_uri')
+        affected_bins, previous_winners = read_previous_winners(args.previous_filtered, args.affected_bins)
+
+    drop_columns = set(read_criteria_names(args.criteria_tsv)) | {'ranking'}
+    filter_by_group(args.input_file, args.output_file, drop_columns, args.group_by, args.top_k, args.tie_break, args.workers,
+                    affected_bins, previous_winners)
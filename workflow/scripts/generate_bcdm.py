@@ -0,0 +1,309 @@
+"""
+Script: generate_bcdm.py
+Description: This script generates a synthetic BOLD data snapshot in the BCDM TSV format for
+             testing and benchmarking. Records are drawn from a fixed random seed, so the same
+             arguments always produce the same file. Null rates and the values of the text
+             columns follow those seen in BOLD snapshots, including the keywords the criteria
+             look for, and species and BINs follow a long-tailed distribution.
+Input:
+    - rows: Number of records to generate (e.g. 10000, 1000000 or 10000000).
+    - seed: Random seed.
+Output:
+    - output_tsv: Path to the output BCDM TSV file.
+"""
+
+import argparse
+import numpy as np
+import pandas as pd
+
+SEED = 42
+CHUNK_ROWS = 100000  # Records generated per chunk; part of the seed, so it is fixed
+SEQUENCE_POOL = 2000  # Distinct sequences records are drawn from
+
+COLUMNS = [
+    'processid', 'sampleid', 'fieldid', 'museumid', 'record_id', 'specimenid', 'processid_minted_date', 'bin_uri',
+    'bin_created_date', 'collection_code', 'inst', 'taxid', 'kingdom', 'phylum', 'class', 'order', 'family',
+    'subfamily', 'tribe', 'genus', 'species', 'subspecies', 'species_reference', 'identification',
+    'identification_method', 'identification_rank', 'identified_by', 'identifier_email', 'taxonomy_notes', 'sex',
+    'reproduction', 'life_stage', 'short_note', 'notes', 'voucher_type', 'tissue_type', 'specimen_linkout',
+    'associated_specimens', 'associated_taxa', 'collectors', 'collection_date_start', 'collection_date_end',
+    'collection_event_id', 'collection_time', 'collection_notes', 'geoid', 'country/ocean', 'country_iso',
+    'province/state', 'region', 'sector', 'site', 'site_code', 'coord', 'coord_accuracy', 'coord_source', 'elev',
+    'elev_accuracy', 'depth', 'depth_accuracy', 'habitat', 'sampling_protocol', 'nuc', 'nuc_basecount',
+    'insdc_acs', 'funding_src', 'marker_code', 'primers_forward', 'primers_reverse', 'sequence_run_site',
+    'sequence_upload_date', 'bold_recordset_code_arr',
+]
+
+# Fraction of records without a value, per column (columns not listed are always filled)
+NULL_RATES = {
+    'fieldid': 0.3, 'museumid': 0.55, 'bin_uri': 0.1, 'bin_created_date': 0.1, 'collection_code': 0.8, 'inst': 0.02,
+    'subfamily': 0.5, 'tribe': 0.8, 'species_reference': 0.9, 'identification_method': 0.45,
+    'identified_by': 0.3, 'identifier_email': 0.85, 'taxonomy_notes': 0.93, 'sex': 0.7, 'reproduction': 0.9,
+    'life_stage': 0.6, 'short_note': 0.85, 'notes': 0.8, 'voucher_type': 0.35, 'tissue_type': 0.6,
+    'specimen_linkout': 0.97, 'associated_specimens': 0.97, 'associated_taxa': 0.97, 'subspecies': 0.98,
+    'collectors': 0.25, 'collection_date_start': 0.3, 'collection_date_end': 0.6, 'collection_event_id': 0.8,
+    'collection_time': 0.9, 'collection_notes': 0.9, 'country/ocean': 0.05, 'country_iso': 0.06,
+    'province/state': 0.2, 'region': 0.35, 'sector': 0.5, 'site': 0.4, 'site_code': 0.7, 'coord': 0.3,
+    'coord_accuracy': 0.8, 'coord_source': 0.8, 'elev': 0.6, 'elev_accuracy': 0.9, 'depth': 0.97,
+    'depth_accuracy': 0.99, 'habitat': 0.7, 'sampling_protocol': 0.6, 'nuc': 0.08, 'nuc_basecount': 0.08,
+    'insdc_acs': 0.5, 'funding_src': 0.6, 'primers_forward': 0.4, 'primers_reverse': 0.4,
+    'sequence_run_site': 0.1, 'sequence_upload_date': 0.08,
+}
+
+# Text values with their relative frequencies
+VOCABULARIES = {
+    'inst': {
+        'Centre for Biodiversity Genomics': 40, 'Mined from GenBank, NCBI': 25, 'Zoologische Staatssammlung Muenchen': 6,
+        'Zoologisches Forschungsmuseum Alexander Koenig': 5, 'Smithsonian Institution, National Museum of Natural History': 5,
+        'Naturalis Biodiversity Center': 4, 'Research Collection of Stefan Schmidt': 3, 'Unknown': 3,
+        'Private Collection of J. Smith': 2, 'Natural History Museum, London': 4, 'University of Guelph': 3,
+    },
+    'voucher_type': {
+        'Vouchered:Registered Collection': 35, 'DNA/Tissue Vouchered Only': 15, 'Museum Vouchered:Type': 3,
+        'e-Vouchered': 8, 'Vouchered:Private Collection': 6, 'Photo Voucher Only': 5, 'Voucher not specified': 4,
+        'Herbarium sheet': 3, 'deposited at CBG': 3, 'no voucher': 2, 'Vouchered:National Collection': 4,
+    },
+    'identification_method': {
+        'Morphology': 25, 'BIN Taxonomy Match (May 2023)': 15, 'Tree based Identification (Jan 2023)': 10,
+        'BOLD ID Engine': 8, 'morphological identification': 8, 'DNA Barcoding': 6, 'Genitalia examination': 5,
+        'Expert identification': 4, 'visual identification': 4, 'BLAST': 3, 'identification key': 3,
+        'Literature and type comparison': 2, 'photo': 2, 'morphology and COI barcode': 3, 'Sequence similarity': 2,
+    },
+    'identified_by': {
+        'Kate Perez': 10, 'Angela Telfer': 8, 'BOLD ID Engine': 6, 'Paul Hebert': 5, 'Dieter Doczkal': 4,
+        'Stefan Schmidt': 4, 'Jeremy deWaard': 4, 'Monica Young': 3, 'Axel Hausmann': 3, 'Ximo Mengual': 2,
+        'Valerie Levesque-Beaudin': 3, 'Gerhard Haszprunar': 2, 'Bernhard Rulik': 2, 'Olga Schmidt': 2,
+    },
+    'taxonomy_notes': {
+        'Holotype': 2, 'Paratype': 5, 'paratype female': 1, 'Lectotype': 1, 'Syntype': 1, 'allotype': 1,
+        'BIN conflict, re-examined': 3, 'det. from photo': 3, 'sequence contaminated?': 2, 'cryptic species complex': 4,
+    },
+    'sex': {'female': 5, 'male': 5, 'F': 1, 'M': 1, 'worker': 1},
+    'reproduction': {'sexual': 3, 'asexual': 1},
+    'life_stage': {'adult': 10, 'larva': 3, 'pupa': 1, 'nymph': 1, 'juvenile': 1},
+    'tissue_type': {'leg': 5, 'whole specimen': 4, 'muscle tissue': 2, 'abdomen': 1},
+    'collectors': {
+        'BIO Collections Staff': 10, 'Malaise trap team': 6, 'J. Smith': 4, 'D. Doczkal, J. Voith': 3,
+        'GBOL team': 5, 'A. Mueller': 2, 'Local parataxonomists': 3, 'K. Perez, A. Telfer': 2,
+    },
+    'country/ocean': {
+        'Canada': 25, 'Germany': 15, 'United States': 12, 'Costa Rica': 8, 'South Africa': 5, 'Australia': 5,
+        'Finland': 4, 'Pakistan': 4, 'Brazil': 4, 'Madagascar': 3, 'Norway': 3, 'Pacific Ocean': 2, 'Unrecoverable': 1,
+    },
+    'habitat': {'forest': 5, 'meadow': 3, 'wetland': 2, 'urban garden': 1, 'coastal dunes': 1},
+    'sampling_protocol': {'Malaise trap': 10, 'Light trap': 4, 'Hand collected': 5, 'Pitfall trap': 3, 'Sweep net': 2},
+    'coord_source': {'GPS': 5, 'Georeferenced': 2, 'Google Earth': 1},
+    'funding_src': {'iBOL': 5, 'GBOL III': 3, 'BIOSCAN': 2, 'CBG': 2},
+    'sequence_run_site': {'Centre for Biodiversity Genomics': 20, 'Mined from GenBank, NCBI': 10, 'Naturalis Biodiversity Center': 2},
+    'identification_rank': {'species': 60, 'genus': 20, 'family': 12, 'subfamily': 3, 'order': 5},
+    'short_note': {'damaged specimen': 1, 'legs missing': 1, 'ex ethanol': 1},
+    'notes': {'see photo': 1, 'specimen in ethanol': 1, 'pinned': 2},
+    'collection_notes': {'at light': 1, 'on flowers': 1, 'in leaf litter': 1},
+}
+
+KINGDOMS = {'Animalia': 92, 'Plantae': 5, 'Fungi': 3}
+SYLLABLES = ['ka', 'lo', 'mi', 'nu', 'ra', 'pe', 'ti', 'so', 've', 'xa', 'lu', 'dor', 'phy', 'ter', 'cho', 'gan']
+LETTERS = np.array(list('ABCDEFGHIJKLMNOPQRSTUVWXYZ'))
+
+def choose(rng, vocabulary, size):
+    """
+    Draws values from a vocabulary according to the relative frequencies.
+    """
+    values = np.array(list(vocabulary.keys()), dtype=object)
+    weights = np.array(list(vocabulary.values()), dtype=float)
+    return values[rng.choice(len(values), size=size, p=weights / weights.sum())]
+
+def zipf_index(rng, n, size, a=1.3):
+    """
+    Draws indices in [0, n) with a long-tailed distribution: few frequent values, many rare ones.
+    """
+    return (rng.zipf(a, size=size) - 1) % n
+
+def make_name(rng, syllables, suffix=''):
+    """
+    Builds a Latin-looking name from random syllables.
+    """
+    return ''.join(rng.choice(SYLLABLES, size=syllables)) + suffix
+
+def make_taxonomy(rng, n_species):
+    """
+    Builds the species pool: a lineage (kingdom to genus) and a name for every species.
+    About one in five names is left open ('Genus sp. ...') as in real uploads.
+    """
+    kingdoms = choose(rng, KINGDOMS, n_species)
+    n_genera = max(1, n_species // 4)
+    genera = np.array([make_name(rng, 3).capitalize() for _ in range(n_genera)], dtype=object)
+    families = np.array([make_name(rng, 3, 'idae').capitalize() for _ in range(max(1, n_genera // 5))], dtype=object)
+    orders = np.array([make_name(rng, 2, 'ptera').capitalize() for _ in range(max(1, len(families) // 8))], dtype=object)
+    genus_index = rng.integers(0, n_genera, n_species)
+    family_index = genus_index % len(families)
+    epithets = np.array([make_name(rng, 3) for _ in range(n_species)], dtype=object)
+    names = genera[genus_index] + ' ' + epithets
+    open_names = rng.random(n_species) < 0.2
+    names[open_names] = genera[genus_index[open_names]] + ' sp. ' + epithets[open_names].astype(str)
+    return pd.DataFrame({
+        'kingdom': kingdoms,
+        'phylum': np.where(kingdoms == 'Animalia', 'Arthropoda', np.where(kingdoms == 'Plantae', 'Tracheophyta', 'Basidiomycota')),
+        'class': np.where(kingdoms == 'Animalia', 'Insecta', np.where(kingdoms == 'Plantae', 'Magnoliopsida', 'Agaricomycetes')),
+        'order': orders[family_index % len(orders)],
+        'family': families[family_index],
+        'subfamily': families[family_index].astype(str).astype(object) + 'inae',
+        'tribe': genera[genus_index] + 'ini',
+        'genus': genera[genus_index],
+        'species': names,
+    })
+
+def make_sequences(rng, size):
+    """
+    Builds the sequence pool. Most sequences are full-length COI-5P barcodes (about 658 bp);
+    some are short or long, and they include gap runs, leading/trailing gaps and ambiguity codes.
+    """
+    bases = np.array(list('ACGT'))
+    lengths = np.concatenate([rng.integers(600, 660, int(size * 0.8)), rng.integers(150, 500, int(size * 0.15))])
+    lengths = np.concatenate([lengths, rng.integers(1000, 1550, size - len(lengths))])
+    sequences = []
+    for length in rng.permutation(lengths):
+        sequence = bases[rng.integers(0, 4, length)]
+        ambiguities = rng.random(length) < rng.choice([0, 0.002, 0.02], p=[0.6, 0.3, 0.1])
+        sequence[ambiguities] = rng.choice(list('NRYKMSW'), ambiguities.sum())
+        text = ''.join(sequence)
+        if rng.random() < 0.2:
+            position = rng.integers(0, length)
+            text = text[:position] + '-' * rng.integers(1, 30) + text[position:]
+        if rng.random() < 0.3:
+            text = '-' * rng.integers(1, 60) + text + '-' * rng.integers(0, 40)
+        sequences.append(text)
+    return np.array(sequences, dtype=object)
+
+def make_codes(rng, size, letters=4, digits=0):
+    """
+    Builds distinct codes of uppercase letters followed by digits, such as project codes
+    (ABCD) or BIN suffixes (ABC1234).
+    """
+    numbers = rng.choice(26 ** letters * 10 ** digits, size=size, replace=False)
+    codes = pd.Series(numbers % 10 ** digits).map(f'{{:0{digits}d}}'.format).values if digits else np.full(size, '', dtype=object)
+    numbers //= 10 ** digits
+    for _ in range(letters):
+        codes = LETTERS[numbers % 26].astype(object) + codes
+        numbers //= 26
+    return codes
+
+def random_dates(rng, size, start='1995-01-01', end='2024-06-30'):
+    """
+    Draws ISO dates uniformly between two dates.
+    """
+    first, last = np.datetime64(start), np.datetime64(end)
+    return (first + rng.integers(0, (last - first).astype(int), size)).astype(str).astype(object)
+
+def generate_chunk(rng, offset, size, pools):
+    """
+    Generates one chunk of records starting at record number `offset`.
+    """
+    numbers = np.arange(offset, offset + size)
+    codes = pools['codes']
+    processids = codes[numbers % len(codes)] + pd.Series(numbers // len(codes) + 1).map('{:05d}'.format).values \
+        + '-' + pd.Series(rng.integers(5, 25, size)).map('{:02d}'.format).values
+    species_index = zipf_index(rng, len(pools['taxonomy']), size)
+    taxonomy = pools['taxonomy'].iloc[species_index].reset_index(drop=True)
+    # Most species map to one BIN, some split across several
+    bin_index = (species_index + (rng.random(size) < 0.15) * rng.integers(1, 4, size)) % len(pools['bins'])
+    sequence_index = rng.integers(0, len(pools['sequences']), size)
+    latitudes, longitudes = rng.uniform(-60, 75, size).round(3), rng.uniform(-180, 180, size).round(3)
+
+    # Records identified above species level have no species name
+    rank = choose(rng, VOCABULARIES['identification_rank'], size)
+    species = taxonomy['species'].values.copy()
+    species[rank != 'species'] = ''
+
+    chunk = {
+        'processid': processids,
+        'sampleid': 'BIOUG' + pd.Series(numbers * 7 % 10000019).map('{:08d}'.format).values,
+        'fieldid': 'L#' + pd.Series(rng.integers(0, 999999, size)).astype(str).values,
+        'museumid': choose(rng, {'CBG': 4, 'ZSM': 2, 'ZFMK': 2, 'USNM': 1, 'NHMUK': 1}, size) + '-' + pd.Series(rng.integers(1, 10 ** 6, size)).astype(str).values,
+        'record_id': processids + '.COI-5P',
+        'specimenid': (numbers + 1000000).astype(str).astype(object),
+        'processid_minted_date': random_dates(rng, size, '2005-01-01'),
+        'bin_uri': pools['bins'][bin_index],
+        'bin_created_date': random_dates(rng, size, '2010-01-01'),
+        'collection_code': choose(rng, {'ENT': 3, 'HYM': 1, 'LEP': 1}, size),
+        'taxid': (species_index + 10000).astype(str).astype(object),
+        'subspecies': taxonomy['species'].values + ' ' + 'ssp',
+        'species_reference': 'Linnaeus, ' + pd.Series(rng.integers(1758, 2020, size)).astype(str).values,
+        'identification': np.where(rank == 'species', taxonomy['species'].values, taxonomy['genus'].values),
+        'identification_rank': rank,
+        'identifier_email': 'curator@example.org',
+        'specimen_linkout': 'https://example.org/specimen/' + numbers.astype(str).astype(object),
+        'associated_specimens': 'host of ' + processids,
+        'associated_taxa': taxonomy['genus'].values,
+        'collection_date_start': random_dates(rng, size),
+        'collection_date_end': random_dates(rng, size),
+        'collection_event_id': 'E' + pd.Series(rng.integers(0, 50000, size)).astype(str).values,
+        'collection_time': pd.Series(rng.integers(0, 24, size)).map('{:02d}:00'.format).values,
+        'geoid': rng.integers(1, 300, size).astype(str).astype(object),
+        'country_iso': choose(rng, {'CA': 25, 'DE': 15, 'US': 12, 'CR': 8, 'ZA': 5, 'AU': 5}, size),
+        'province/state': choose(rng, {'Ontario': 10, 'Bavaria': 5, 'North Rhine-Westphalia': 4, 'Guanacaste': 4, 'California': 3}, size),
+        'region': choose(rng, {'Wellington County': 3, 'Oberbayern': 2, 'Area de Conservacion Guanacaste': 2}, size),
+        'sector': choose(rng, {'Sector Pitilla': 2, 'rare Charitable Research Reserve': 1, 'Kottenforst': 1}, size),
+        'site': 'Site ' + pd.Series(rng.integers(1, 20000, size)).astype(str).values,
+        'site_code': 'S' + pd.Series(rng.integers(1, 2000, size)).astype(str).values,
+        'coord': '[' + pd.Series(latitudes).astype(str).values + ',' + pd.Series(longitudes).astype(str).values + ']',
+        'coord_accuracy': rng.integers(1, 5000, size).astype(str).astype(object),
+        'elev': rng.integers(-10, 3500, size).astype(str).astype(object),
+        'elev_accuracy': rng.integers(1, 100, size).astype(str).astype(object),
+        'depth': rng.integers(0, 200, size).astype(str).astype(object),
+        'depth_accuracy': rng.integers(1, 20, size).astype(str).astype(object),
+        'nuc': pools['sequences'][sequence_index],
+        'nuc_basecount': pools['basecounts'][sequence_index],
+        'insdc_acs': 'MZ' + pd.Series(rng.integers(0, 999999, size)).map('{:06d}'.format).values,
+        'marker_code': 'COI-5P',
+        'primers_forward': choose(rng, {'LepF1': 3, 'LCO1490': 2, 'MLepF1': 1}, size),
+        'primers_reverse': choose(rng, {'LepR1': 3, 'HCO2198': 2, 'MLepR2': 1}, size),
+        'sequence_upload_date': random_dates(rng, size, '2008-01-01'),
+        'bold_recordset_code_arr': "['" + codes[numbers % len(codes)] + "', 'DS-" + codes[(numbers * 31) % len(codes)] + "']",
+    }
+    for column in taxonomy.columns:
+        if column not in chunk:
+            chunk[column] = taxonomy[column].values
+    chunk['species'] = species
+    for column, vocabulary in VOCABULARIES.items():
+        if column not in chunk:
+            chunk[column] = choose(rng, vocabulary, size)
+
+    for column, rate in NULL_RATES.items():
+        values = np.array(np.broadcast_to(np.asarray(chunk[column], dtype=object), size))
+        values[rng.random(size) < rate] = ''
+        chunk[column] = values
+    return pd.DataFrame(chunk, dtype=object)[COLUMNS]
+
+def generate_bcdm(rows, output_tsv, seed=SEED):
+    """
+    Writes a synthetic BCDM TSV file with the given number of records.
+    """
+    rng = np.random.default_rng(seed)
+    n_species = max(50, rows // 25)
+    sequences = make_sequences(rng, SEQUENCE_POOL)
+    bins = 'BOLD:' + make_codes(rng, n_species + 3, 3, 4)
+    pools = {
+        'taxonomy': make_taxonomy(rng, n_species).astype(object),
+        'sequences': sequences,
+        'basecounts': np.array([str(len(s.replace('-', ''))) for s in sequences], dtype=object),
+        'bins': bins,
+        'codes': make_codes(rng, max(20, rows // 20000)),
+    }
+
+    with open(output_tsv, 'w', encoding='utf-8', newline='') as outfile:
+        outfile.write('\t'.join(COLUMNS) + '\n')
+        for index, offset in enumerate(range(0, rows, CHUNK_ROWS)):
+            chunk = generate_chunk(np.random.default_rng([seed, index]), offset, min(CHUNK_ROWS, rows - offset), pools)
+            # All values are strings without tabs or newlines, so lines are joined directly
+            columns = [chunk[column].tolist() for column in COLUMNS]
+            outfile.writelines('\t'.join(row) + '\n' for row in zip(*columns))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic BOLD data snapshot in the BCDM TSV format.")
+    parser.add_argument('--rows', required=True, type=int, help="Number of records to generate.")
+    parser.add_argument('--output_tsv', required=True, help="Path to the output TSV file.")
+    parser.add_argument('--seed', required=False, type=int, default=SEED, help="Random seed; the same seed gives the same file.")
+    args = parser.parse_args()
+
+    generate_bcdm(args.rows, args.output_tsv, args.seed)
@@ -0,0 +1,199 @@
+"""
+Script: has_image.py
+Description: This module assesses the HAS_IMAGE criterion by querying the BOLD images API.
+             Records are streamed from the input in chunks, requests run concurrently under
+             a semaphore, and results are written to the output TSV in input order as soon
+             as they are available.
+Input:
+    - bold_data_tsv: Path to the input BOLD data TSV file (only processid and record_id are read).
+    - base_url: URL of the images API, followed by a comma-separated list of process IDs.
+    - cache: Optional ImageCache with the lookups of previous runs.
+Output:
+    - output_tsv: Path to the output TSV file with the HAS_IMAGE criterion.
+    - output_npy: Path to the output int8 array with the HAS_IMAGE criterion (columnar backend).
+    - image_url_tsv: Path to the output TSV file containing the image URLs (if specified).
+"""
+
+import csv
+import time
+import contextlib
+import random
+import asyncio
+import logging
+import numpy as np
+import pandas as pd
+from aiohttp import ClientSession, ClientTimeout, ClientError, TCPConnector
+from columnar import UNKNOWN, finish_column
+import instrumentation
+
+# Constants for HAS_IMAGE criterion
+BASE_URL = 'https://caos.boldsystems.org:443/api/images?processids='
+IMAGE_URL = 'https://caos.boldsystems.org:443/api/objects/'
+CHUNK_SIZE = 200  # Number of process IDs per request
+READ_CHUNK_SIZE = 10000  # Number of records read from the input at a time
+SLEEP = 0.5  # Base delay in seconds for the exponential backoff
+MAX_SLEEP = 30  # Upper bound in seconds for a single backoff delay
+MAX_RETRIES = 3  # Maximum number of retries for failed requests
+CONCURRENT_REQUESTS = 300  # Limit the number of concurrent requests
+PENDING_CHUNKS = 2 * CONCURRENT_REQUESTS  # Limit the number of chunks held in memory
+
+def backoff_delay(attempt):
+    """
+    Returns the delay before the given retry, using exponential backoff with full jitter.
+    """
+    return random.uniform(0, min(MAX_SLEEP, SLEEP * 2 ** attempt))
+
+async def fetch_images(session, base_url, process_ids):
+    """
+    Fetches the image records for a comma-separated list of process IDs, retrying
+    failed requests with exponential backoff.
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        started = time.perf_counter()
+        try:
+            async with session.get(base_url + process_ids, timeout=ClientTimeout(total=60)) as response:
+                if response.status == 200:
+                    images = await response.json()
+                    instrumentation.observe('has_image_request_seconds', time.perf_counter() - started)
+                    return images
+                logging.error(f"Failed to fetch images: {response.status} {response.reason}")
+                error = f"{response.status} {response.reason}"
+        except (asyncio.TimeoutError, ClientError) as e:
+            logging.error(f"Error fetching images: {type(e).__name__} {e}")
+            error = f"{type(e).__name__} {e}"
+        instrumentation.observe('has_image_failed_request_seconds', time.perf_counter() - started)
+
+        if attempt < MAX_RETRIES:
+            instrumentation.add('has_image_retries')
+            delay = backoff_delay(attempt)
+            logging.info(f"Retrying in {delay:.2f}s... ({attempt + 1}/{MAX_RETRIES})")
+            await asyncio.sleep(delay)
+    raise Exception(f"Failed to fetch images after {MAX_RETRIES} retries: {error}")
+
+def index_response(response):
+    """
+    Indexes an API response as {processid: objectid}; the first item for a process ID wins.
+    """
+    images = {}
+    for item in response or []:
+        images.setdefault(item['processid'], item['objectid'])
+    return images
+
+def match_images(chunk, images):
+    """
+    Matches the records of a chunk against {processid: objectid} lookups. Returns
+    (record_id, has_image, objectid) tuples in chunk order; objectid is None for
+    records without an image.
+    """
+    matches = []
+    for record_id, processid in zip(chunk['record_id'], chunk['processid']):
+        objectid = images.get(processid)
+        matches.append((record_id, 0, None) if objectid is None else (record_id, 1, objectid))
+    return matches
+
+def read_chunks(bold_data_tsv):
+    """
+    Streams (processid, record_id) chunks of CHUNK_SIZE records from the input.
+    """
+    for frame in pd.read_csv(bold_data_tsv, sep='\t', usecols=['processid', 'record_id'], dtype=str, chunksize=READ_CHUNK_SIZE):
+        for i in range(0, len(frame), CHUNK_SIZE):
+            yield frame.iloc[i:i + CHUNK_SIZE]
+
+class OrderedWriter:
+    """
+    Writes chunk results in input order, holding back chunks that complete early.
+    """
+
+    def __init__(self, output, image_urls, window, flags=None):
+        self.output = output
+        self.image_urls = image_urls
+        self.flags = flags
+        self.window = window
+        self.pending = {}
+        self.next_index = 0
+        self.records = 0
+        self.failed = 0
+
+    def put(self, index, matches):
+        self.pending[index] = matches
+        while self.next_index in self.pending:
+            matches = self.pending.pop(self.next_index)
+            if self.flags is not None:
+                # Columnar output: one byte per record, UNKNOWN for failed chunks
+                self.flags.write(np.array([UNKNOWN if has_image is None else has_image for _, has_image, _ in matches], dtype=np.int8).tobytes())
+            for record_id, has_image, objectid in matches:
+                # Records of failed chunks are written with an empty (unknown) value
+                if self.output is not None:
+                    self.output.writerow([record_id, '' if has_image is None else has_image])
+                if self.image_urls is not None and objectid is not None:
+                    self.image_urls.writerow([record_id, f"{IMAGE_URL}{objectid}"])
+                self.records += 1
+                self.failed += has_image is None
+            self.next_index += 1
+            self.window.release()
+
+async def assess_chunk(session, requests, base_url, cache, index, chunk, writer):
+    """
+    Looks up the images of one chunk, in the cache first and then through the API
+    for the misses, and hands the result to the writer.
+    """
+    process_ids = list(dict.fromkeys(chunk['processid'].dropna()))
+    try:
+        images = cache.lookup(process_ids) if cache else {}
+        missing = [pid for pid in process_ids if pid not in images]
+        if missing:
+            async with requests:
+                response = await fetch_images(session, base_url, ','.join(missing))
+            fetched = index_response(response)
+            fetched = {pid: fetched.get(pid) for pid in missing}
+            if cache:
+                cache.store(fetched)
+            images.update(fetched)
+        matches = match_images(chunk, images)
+    except Exception as e:
+        logging.error(f"Error fetching images for chunk {index}: {e}")
+        instrumentation.add('has_image_failed_chunks')
+        matches = [(record_id, None, None) for record_id in chunk['record_id']]
+    writer.put(index, matches)
+
+async def assess_has_image(bold_data_tsv, output_tsv, image_url_flag, image_url_tsv, base_url=BASE_URL, cache=None, output_npy=None):
+    """
+    Assesses the HAS_IMAGE criterion for each record and streams it to the output TSV,
+    or to an int8 array if output_npy is given. If an ImageCache is given, only uncached
+    or expired process IDs are fetched.
+    """
+    requests = asyncio.Semaphore(CONCURRENT_REQUESTS)
+    window = asyncio.Semaphore(PENDING_CHUNKS)
+
+    with contextlib.ExitStack() as stack:
+        output = flags = image_urls = None
+        if output_npy:
+            flags = stack.enter_context(open(output_npy + '.part', 'wb'))
+        else:
+            output = csv.writer(stack.enter_context(open(output_tsv, 'w', newline='')), delimiter='\t', lineterminator='\n')
+            output.writerow(['record_id', 'HAS_IMAGE'])
+        if image_url_flag:
+            image_urls = csv.writer(stack.enter_context(open(image_url_tsv, 'w', newline='')), delimiter='\t', lineterminator='\n')
+            image_urls.writerow(['record_id', 'image_url'])
+        writer = OrderedWriter(output, image_urls, window, flags)
+
+        async with ClientSession(connector=TCPConnector(limit=CONCURRENT_REQUESTS)) as session:
+            tasks = set()
+            for index, chunk in enumerate(instrumentation.timed(read_chunks(bold_data_tsv), 'parse')):
+                await window.acquire()
+                task = asyncio.create_task(assess_chunk(session, requests, base_url, cache, index, chunk, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+
+    if output_npy:
+        finish_column(output_npy)
+
+    instrumentation.add('rows', writer.records)
+    instrumentation.add('has_image_failed_records', writer.failed)
+    logging.info(f"Assessed HAS_IMAGE for {writer.records} records ({writer.failed} could not be fetched)")
+    if cache:
+        instrumentation.add('image_cache_hits', cache.hits)
+        instrumentation.add('image_cache_misses', cache.misses)
+        logging.info(f"Image cache: {cache.hits} hits, {cache.misses} misses")
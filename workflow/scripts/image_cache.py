@@ -0,0 +1,87 @@
+"""
+Script: image_cache.py
+Description: This module provides a persistent SQLite cache of HAS_IMAGE lookups, so that
+             re-runs on a new BOLD snapshot only query the images API for process IDs that
+             are new or whose cached entry has expired.
+Input:
+    - path: Path to the SQLite cache file (created if it does not exist).
+    - ttl_days: Number of days a cached lookup stays valid (0 keeps entries forever).
+Output:
+    - The cache file, with one row per process ID: has_image, objectid and fetched_at.
+"""
+
+import os
+import time
+import logging
+import sqlite3
+
+SECONDS_PER_DAY = 86400
+QUERY_BATCH = 500  # Stay well below SQLite's limit on bound parameters
+
+class ImageCache:
+    """
+    Maps process IDs to (has_image, objectid, fetched_at), with TTL-based expiry.
+    """
+
+    def __init__(self, path, ttl_days):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.ttl = ttl_days * SECONDS_PER_DAY if ttl_days > 0 else None
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS images ('
+            'processid TEXT PRIMARY KEY, has_image INTEGER NOT NULL, objectid TEXT, fetched_at REAL NOT NULL)'
+        )
+        self.connection.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def cutoff(self):
+        return time.time() - self.ttl if self.ttl else 0
+
+    def evict_expired(self):
+        """
+        Deletes entries older than the TTL and returns their number.
+        """
+        evicted = self.connection.execute('DELETE FROM images WHERE fetched_at < ?', (self.cutoff(),)).rowcount
+        self.connection.commit()
+        if evicted:
+            logging.info(f"Evicted {evicted} expired entries from the image cache")
+        return evicted
+
+    def lookup(self, process_ids):
+        """
+        Returns {processid: objectid} for the process IDs with a valid entry; objectid
+        is None for process IDs known to have no image.
+        """
+        found = {}
+        cutoff = self.cutoff()
+        for i in range(0, len(process_ids), QUERY_BATCH):
+            batch = process_ids[i:i + QUERY_BATCH]
+            rows = self.connection.execute(
+                f"SELECT processid, has_image, objectid FROM images "
+                f"WHERE fetched_at >= ? AND processid IN ({','.join('?' * len(batch))})",
+                [cutoff, *batch],
+            )
+            for processid, has_image, objectid in rows:
+                found[processid] = objectid if has_image else None
+        self.hits += len(found)
+        self.misses += len(process_ids) - len(found)
+        return found
+
+    def store(self, images):
+        """
+        Stores fetched lookups given as {processid: objectid or None}.
+        """
+        fetched_at = time.time()
+        self.connection.executemany(
+            'INSERT OR REPLACE INTO images (processid, has_image, objectid, fetched_at) VALUES (?, ?, ?, ?)',
+            [(pid, 0 if objectid is None else 1, None if objectid is None else str(objectid), fetched_at)
+             for pid, objectid in images.items()],
+        )
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,328 @@
+"""
+Script: incremental.py
+Description: This script supports incremental curation between BOLD snapshots. Each record
+             is fingerprinted by hashing the columns the configured criteria read (plus its
+             bin_uri). Given the fingerprints of a previous run, only new or changed records
+             are assessed and ranked; all other records carry their criteria and ranking
+             forward from the previous output. Every run also stores a digest of what the
+             criteria and rankings depend on besides the records (criteria, keyword rules,
+             SEQ_QUALITY thresholds, ranking tiers and the code computing them); if it differs
+             from the previous run's digest, every record is assessed and ranked again.
+Commands:
+    - fingerprint: Writes the fingerprints of a snapshot (for runs without a previous run).
+    - split: Writes the fingerprints, the new or changed records, and the bin_uris whose
+             membership or records changed since the previous run.
+    - merge: Combines the ranked changed records with the carried-forward results into
+             the full ranked output for the snapshot.
+Input:
+    - bold_data_tsv: Path to the BOLD data TSV file of the current snapshot.
+    - criteria: String of criteria separated by spaces.
+    - previous_fingerprints / previous_output / previous_digest: Fingerprints, ranked output and
+      criteria digest of the previous run.
+    - keyword_rules / ranking_tiers / seq_*: Criteria configuration, hashed into the digest.
+    - memory_mb: Memory budget; sizes the chunks of the snapshot and the sorted runs of the record_ids.
+Output:
+    - fingerprints_tsv: record_id, bin_uri and fingerprint of every record.
+    - digest_txt: Digest of the criteria configuration (fingerprint, split).
+    - delta_tsv / affected_bins: Records to assess and bins to re-select (split).
+    - output_tsv: Ranked output for the whole snapshot (merge).
+"""
+
+import os
+import json
+import heapq
+import hashlib
+import argparse
+import logging
+import tempfile
+import numpy as np
+import pandas as pd
+import instrumentation
+import memory_budget
+from access_criteria import CRITERION_COLUMNS, KEYWORD_RULES_TSV
+from columnar import column_path, UNKNOWN
+from ranking_score import RANKING_TIERS_TSV, write_sorted_runs, read_run, write_record_runs, join_runs
+from sequence_stats import THRESHOLDS
+
+CHUNK_SIZE = 100000  # Largest number of records per chunk; fewer if the memory budget requires
+
+# Scripts whose code determines the criteria and rankings of a record
+CRITERIA_SCRIPTS = ['access_criteria.py', 'keyword_rules.py', 'sequence_stats.py', 'has_image.py', 'ranking_score.py']
+
+def criteria_digest(criteria, keyword_rules_tsv=KEYWORD_RULES_TSV, ranking_tiers_tsv=RANKING_TIERS_TSV, seq_thresholds=THRESHOLDS):
+    """
+    Returns a digest of the criteria configuration: the criteria, the SEQ_QUALITY thresholds,
+    and the contents of the keyword rules, the ranking tiers and the criteria scripts.
+    """
+    digest = hashlib.sha256(json.dumps({'criteria': criteria, 'seq_thresholds': seq_thresholds}, sort_keys=True).encode('utf-8'))
+    scripts = os.path.dirname(os.path.abspath(__file__))
+    for path in [keyword_rules_tsv, ranking_tiers_tsv] + [os.path.join(scripts, script) for script in CRITERIA_SCRIPTS]:
+        with open(path, 'rb') as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+def read_digest(digest_txt):
+    """
+    Reads a digest written by a previous run.
+    """
+    with open(digest_txt, 'r', encoding='utf-8') as f:
+        return f.read().strip()
+
+def write_digest(digest_txt, digest):
+    """
+    Writes the digest of the criteria configuration of this run.
+    """
+    with open(digest_txt, 'w', encoding='utf-8') as f:
+        f.write(f"{digest}\n")
+
+def fingerprint_columns(criteria):
+    """
+    Returns the columns that make up a record's fingerprint.
+    """
+    columns = {'bin_uri'}
+    for criterion in criteria:
+        columns.update(CRITERION_COLUMNS[criterion])
+    return sorted(columns)
+
+def read_raw_chunks(bold_data_tsv, chunk_size=CHUNK_SIZE):
+    """
+    Streams the BOLD data as unparsed strings, so records are hashed and copied verbatim.
+    """
+    return pd.read_csv(bold_data_tsv, sep='\t', dtype=str, keep_default_na=False, chunksize=chunk_size)
+
+def compute_fingerprints(chunk, columns):
+    """
+    Returns a frame with the record_id, bin_uri and fingerprint of each record in the chunk.
+    """
+    fingerprints = pd.util.hash_pandas_object(chunk[columns], index=False)
+    return pd.DataFrame({'record_id': chunk['record_id'].values, 'bin_uri': chunk['bin_uri'].values,
+                         'fingerprint': fingerprints.values})
+
+def write_fingerprints(bold_data_tsv, criteria, fingerprints_tsv, chunk_size=CHUNK_SIZE):
+    """
+    Writes the fingerprints of every record in the snapshot.
+    """
+    columns = fingerprint_columns(criteria)
+    for i, chunk in enumerate(instrumentation.timed(read_raw_chunks(bold_data_tsv, chunk_size), 'parse')):
+        with instrumentation.phase('evaluate'):
+            fingerprints = compute_fingerprints(chunk, columns)
+        with instrumentation.phase('write'):
+            fingerprints.to_csv(fingerprints_tsv, sep='\t', index=False, mode='w' if i == 0 else 'a', header=i == 0)
+        instrumentation.add('rows', len(chunk))
+    instrumentation.add_file('bytes_read', bold_data_tsv)
+    instrumentation.add_file('bytes_written', fingerprints_tsv)
+
+def unique_record_ids(rows):
+    """
+    Yields the first of each run of sorted rows with the same record_id.
+    """
+    last = None
+    for row in rows:
+        if row[0] != last:
+            yield row
+            last = row[0]
+
+def compare_fingerprints(current_runs, previous_runs, changed, full=False):
+    """
+    Merges sorted runs of the current (record_id, fingerprint, position) with sorted runs of
+    the previous (record_id, bin_uri, fingerprint). Marks the records that are new or whose
+    fingerprint changed (every record with full set) in changed, and returns the previous
+    bin_uris of changed and removed records and the number of removed records.
+    """
+    by_record_id = lambda row: row[0]
+    previous = unique_record_ids(heapq.merge(*(read_run(path) for path in previous_runs), key=by_record_id))
+    affected_bins = set()
+    removed = 0
+    current_previous = next(previous, None)
+    matched = None
+    for record_id, fingerprint, position in heapq.merge(*(read_run(path) for path in current_runs), key=by_record_id):
+        while current_previous is not None and current_previous[0] < record_id:
+            if current_previous[0] != matched:
+                affected_bins.add(current_previous[1])
+                removed += 1
+            current_previous = next(previous, None)
+        if current_previous is not None and current_previous[0] == record_id:
+            matched = record_id
+            if full or current_previous[2] != fingerprint:
+                changed[int(position)] = True
+                affected_bins.add(current_previous[1])
+        else:
+            changed[int(position)] = True
+    while current_previous is not None:
+        if current_previous[0] != matched:
+            affected_bins.add(current_previous[1])
+            removed += 1
+        current_previous = next(previous, None)
+    return affected_bins, removed
+
+def split(bold_data_tsv, criteria, previous_fingerprints_tsv, fingerprints_tsv, delta_tsv, affected_bins_txt, chunk_size=CHUNK_SIZE,
+          run_size=CHUNK_SIZE, full=False):
+    """
+    Writes the records that are new or changed since the previous run, and the bin_uris
+    in which records were added, changed or removed. With full set (the criteria
+    configuration changed) every record counts as changed. The current and previous
+    fingerprints are compared with an external sort-merge on record_id, in sorted runs of
+    run_size records, and the changed records are marked in an array on disk.
+    """
+    write_fingerprints(bold_data_tsv, criteria, fingerprints_tsv, chunk_size)
+
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(delta_tsv))) as directory:
+        with instrumentation.phase('sort'):
+            current_runs, rows = write_record_runs(fingerprints_tsv, directory, run_size, values=['fingerprint'])
+            previous_chunks = pd.read_csv(previous_fingerprints_tsv, sep='\t', usecols=['record_id', 'bin_uri', 'fingerprint'], dtype=str,
+                                          keep_default_na=False, chunksize=run_size)
+            previous_runs = write_sorted_runs((chunk[['record_id', 'bin_uri', 'fingerprint']] for chunk in previous_chunks), directory, 'previous')
+
+        changed = np.lib.format.open_memmap(os.path.join(directory, 'changed.npy'), mode='w+', dtype=bool, shape=(rows,))
+        changed[:] = False
+        with instrumentation.phase('join'):
+            affected_bins, removed = compare_fingerprints(current_runs, previous_runs, changed, full)
+
+        # Changed records also affect the bins they belong to now
+        changed_records = 0
+        start = 0
+        for i, chunk in enumerate(instrumentation.timed(read_raw_chunks(bold_data_tsv, chunk_size), 'parse')):
+            with instrumentation.phase('join'):
+                delta = chunk[np.array(changed[start:start + len(chunk)])]
+                start += len(chunk)
+            with instrumentation.phase('write'):
+                delta.to_csv(delta_tsv, sep='\t', index=False, mode='w' if i == 0 else 'a', header=i == 0)
+            affected_bins.update(delta['bin_uri'])
+            changed_records += len(delta)
+    instrumentation.add('changed_records', changed_records)
+    affected_bins.discard('')
+
+    with open(affected_bins_txt, 'w') as f:
+        for bin_uri in sorted(affected_bins):
+            f.write(f"{bin_uri}\n")
+
+    instrumentation.add_file('bytes_read', bold_data_tsv)
+    instrumentation.add_file('bytes_read', previous_fingerprints_tsv)
+    for path in (delta_tsv, affected_bins_txt):
+        instrumentation.add_file('bytes_written', path)
+
+    logging.info(f"{changed_records} of {rows} records are new or changed; {removed} were removed; {len(affected_bins)} bins affected")
+
+def read_results(output_tsv, criteria, chunk_size):
+    """
+    Streams the record_ids, criteria and rankings of a ranked output. Missing criteria are
+    UNKNOWN and missing rankings 0.
+    """
+    dtypes = {'record_id': str, 'ranking': 'Int64', **{criterion: 'Int8' for criterion in criteria}}
+    columns = ['record_id'] + criteria + ['ranking']
+    for chunk in pd.read_csv(output_tsv, sep='\t', usecols=columns, dtype=dtypes, keep_default_na=False, chunksize=chunk_size):
+        yield chunk[columns].fillna({**{criterion: UNKNOWN for criterion in criteria}, 'ranking': 0})
+
+def merge(bold_data_tsv, criteria, delta_output_tsv, previous_output_tsv, output_tsv, chunk_size=CHUNK_SIZE, run_size=CHUNK_SIZE,
+          full=False):
+    """
+    Writes the ranked output for the whole snapshot: changed records take their criteria
+    and ranking from the delta output, all others from the previous run's output. With
+    full set every record was assessed again and the previous output is not read. The
+    results are joined to the records with an external sort-merge on record_id, as in
+    ranking_score, into columnar arrays in the records' row order.
+    """
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output_tsv))) as directory:
+        with instrumentation.phase('sort'):
+            record_runs, rows = write_record_runs(bold_data_tsv, directory, run_size)
+            delta_runs = write_sorted_runs(read_results(delta_output_tsv, criteria, run_size), directory, 'delta')
+            previous_runs = [] if full else write_sorted_runs(read_results(previous_output_tsv, criteria, run_size), directory, 'previous')
+
+        columns = [np.lib.format.open_memmap(column_path(directory, criterion), mode='w+', dtype=np.int8, shape=(rows,)) for criterion in criteria]
+        for column in columns:
+            column[:] = UNKNOWN
+        rankings = np.lib.format.open_memmap(os.path.join(directory, 'ranking.npy'), mode='w+', dtype=np.int64, shape=(rows,))
+        rankings[:] = 0
+
+        # The delta output is joined last, so its results replace the previous run's
+        with instrumentation.phase('join'):
+            for runs in (previous_runs, delta_runs):
+                join_runs(runs, record_runs, columns + [rankings])
+
+        # Records are kept as text, so their fields are written out as ranking_score writes them
+        start = 0
+        for i, chunk in enumerate(instrumentation.timed(read_raw_chunks(bold_data_tsv, chunk_size), 'parse')):
+            with instrumentation.phase('join'):
+                for criterion, column in zip(criteria, columns):
+                    values = np.array(column[start:start + len(chunk)])
+                    chunk[criterion] = pd.arrays.IntegerArray(values, values == UNKNOWN)
+                chunk['ranking'] = np.array(rankings[start:start + len(chunk)])
+                start += len(chunk)
+            with instrumentation.phase('write'):
+                chunk.to_csv(output_tsv, sep='\t', index=False, mode='w' if i == 0 else 'a', header=i == 0)
+            instrumentation.add('rows', len(chunk))
+    for path in (bold_data_tsv, delta_output_tsv) + (() if full else (previous_output_tsv,)):
+        instrumentation.add_file('bytes_read', path)
+    instrumentation.add_file('bytes_written', output_tsv)
+
+def add_digest_arguments(parser):
+    """
+    Adds the options of the criteria configuration that the digest is computed from.
+    """
+    parser.add_argument('--digest_txt', required=True, help="Path to the output file with the digest of the criteria configuration.")
+    parser.add_argument('--keyword_rules', default=KEYWORD_RULES_TSV, help="Path to the keyword rules TSV file for the text criteria.")
+    parser.add_argument('--ranking_tiers', default=RANKING_TIERS_TSV, help="Path to the TSV file defining the ranking tiers.")
+    parser.add_argument('--seq_min_length', type=int, default=THRESHOLDS['min_length'], help="SEQ_QUALITY: minimum length of the sequences.")
+    parser.add_argument('--seq_max_ambiguity', type=float, default=THRESHOLDS['max_ambiguity'], help="SEQ_QUALITY: maximum fraction of ambiguous bases.")
+    parser.add_argument('--seq_max_gap_runs', type=int, default=THRESHOLDS['max_gap_runs'], help="SEQ_QUALITY: maximum number of internal gap runs.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incremental curation between BOLD snapshots.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--log_file', required=False, help="Path to the log file.")
+    memory_budget.add_arguments(common)
+    instrumentation.add_arguments(common)
+
+    fingerprint_parser = subparsers.add_parser('fingerprint', parents=[common], help="Write the fingerprints of a snapshot.")
+    fingerprint_parser.add_argument('--bold_data_tsv', required=True, help="Path to the BOLD data TSV file.")
+    fingerprint_parser.add_argument('--criteria', required=True, help="String of criteria separated by spaces.")
+    fingerprint_parser.add_argument('--fingerprints_tsv', required=True, help="Path to the output fingerprints TSV file.")
+    add_digest_arguments(fingerprint_parser)
+
+    split_parser = subparsers.add_parser('split', parents=[common], help="Write the records that changed since the previous run.")
+    split_parser.add_argument('--bold_data_tsv', required=True, help="Path to the BOLD data TSV file.")
+    split_parser.add_argument('--criteria', required=True, help="String of criteria separated by spaces.")
+    split_parser.add_argument('--previous_fingerprints', required=True, help="Path to the fingerprints TSV file of the previous run.")
+    split_parser.add_argument('--fingerprints_tsv', required=True, help="Path to the output fingerprints TSV file.")
+    split_parser.add_argument('--delta_tsv', required=True, help="Path to the output TSV file with the new or changed records.")
+    split_parser.add_argument('--affected_bins', required=True, help="Path to the output file listing the affected bin_uris.")
+    split_parser.add_argument('--previous_digest', required=True, help="Path to the criteria digest of the previous run.")
+    add_digest_arguments(split_parser)
+
+    merge_parser = subparsers.add_parser('merge', parents=[common], help="Merge the ranked changed records with the previous results.")
+    merge_parser.add_argument('--bold_data_tsv', required=True, help="Path to the BOLD data TSV file.")
+    merge_parser.add_argument('--criteria', required=True, help="String of criteria separated by spaces.")
+    merge_parser.add_argument('--delta_output', required=True, help="Path to the ranked output of the changed records.")
+    merge_parser.add_argument('--previous_output', required=True, help="Path to the ranked output of the previous run.")
+    merge_parser.add_argument('--output_tsv', required=True, help="Path to the output TSV file.")
+    merge_parser.add_argument('--digest', required=True, help="Path to the criteria digest of this run.")
+    merge_parser.add_argument('--previous_digest', required=True, help="Path to the criteria digest of the previous run.")
+
+    args = parser.parse_args()
+
+    logging.basicConfig(filename=args.log_file, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    instrumentation.start(args.command, args.metrics_json, args.profile)
+
+    criteria = args.criteria.split()
+    chunk_size = memory_budget.chunk_rows(args.bold_data_tsv, args.memory_mb, memory_budget.FULL_ROW_EXPANSION, limit=CHUNK_SIZE)
+    if args.command in ('fingerprint', 'split'):
+        digest = criteria_digest(criteria, args.keyword_rules, args.ranking_tiers,
+                                 {'min_length': args.seq_min_length, 'max_ambiguity': args.seq_max_ambiguity, 'max_gap_runs': args.seq_max_gap_runs})
+        write_digest(args.digest_txt, digest)
+    else:
+        digest = read_digest(args.digest)
+    full = args.command != 'fingerprint' and digest != read_digest(args.previous_digest)
+    if full:
+        logging.warning(f"The criteria configuration differs from the previous run ({args.previous_digest}); all records are assessed and ranked again")
+
+    if args.command == 'fingerprint':
+        write_fingerprints(args.bold_data_tsv, criteria, args.fingerprints_tsv, chunk_size)
+    elif args.command == 'split':
+        # Runs as large as the budget allows, so few run files are open while merging
+        run_size = memory_budget.chunk_rows(args.previous_fingerprints, args.memory_mb, memory_budget.PROJECTED_EXPANSION)
+        split(args.bold_data_tsv, criteria, args.previous_fingerprints, args.fingerprints_tsv, args.delta_tsv, args.affected_bins, chunk_size,
+              run_size, full)
+    elif args.command == 'merge':
+        run_size = memory_budget.chunk_rows(args.bold_data_tsv, args.memory_mb, memory_budget.PROJECTED_EXPANSION)
+        merge(args.bold_data_tsv, criteria, args.delta_output, args.previous_output, args.output_tsv, chunk_size, run_size, full)
@@ -0,0 +1,156 @@
+"""
+Script: instrumentation.py
+Description: This module collects performance metrics for the pipeline scripts: time spent
+             per phase (e.g. parse, evaluate, join, write), rows processed, bytes read and
+             written, peak memory, counters and latency histograms (e.g. of the HAS_IMAGE
+             requests). The metrics of a run are written as JSON when the script exits.
+             Optionally the script is profiled with cProfile; the profile can be opened
+             with pstats or snakeviz. Metrics are collected per process, so work done in
+             worker processes only shows in the phase and memory totals of the parent.
+Output:
+    - metrics_json: Path to the JSON file with the metrics of the run (none is written if omitted).
+    - profile: Path to the cProfile statistics of the run (the run is not profiled if omitted).
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import bisect
+import cProfile
+import resource
+import contextlib
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+_run = None
+
+class Run:
+    """
+    Metrics of one script run.
+    """
+
+    def __init__(self, stage, metrics_json, profile):
+        self.stage = stage
+        self.metrics_json = metrics_json
+        self.profile = profile
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.counters = {'rows': 0, 'bytes_read': 0, 'bytes_written': 0}
+        self.histograms = {}
+        self.status = 'ok'
+        self.profiler = cProfile.Profile() if profile else None
+        if self.profiler:
+            self.profiler.enable()
+
+    def to_dict(self):
+        usage, children = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+        wall_seconds = time.perf_counter() - self.started
+        return {
+            'stage': self.stage,
+            'argv': sys.argv,
+            'status': self.status,
+            'wall_seconds': round(wall_seconds, 3),
+            'cpu_seconds': round(usage.ru_utime + usage.ru_stime + children.ru_utime + children.ru_stime, 3),
+            'peak_rss_mb': round(usage.ru_maxrss / 1024, 1),
+            'children_peak_rss_mb': round(children.ru_maxrss / 1024, 1),
+            'phases': {name: round(seconds, 3) for name, seconds in self.phases.items()},
+            'rows_per_sec': round(self.counters['rows'] / wall_seconds, 1) if wall_seconds > 0 else None,
+            **self.counters,
+            'histograms': self.histograms,
+        }
+
+def start(stage, metrics_json=None, profile=None):
+    """
+    Starts collecting metrics for a script run; they are written when the script exits.
+    """
+    global _run
+    _run = Run(stage, metrics_json, profile)
+    atexit.register(finish)
+
+    # Runs that end with an uncaught exception are marked as failed
+    excepthook = sys.excepthook
+    def mark_failed(*exc_info):
+        if _run is not None:
+            _run.status = 'failed'
+        excepthook(*exc_info)
+    sys.excepthook = mark_failed
+    return _run
+
+def finish():
+    """
+    Stops profiling and writes the metrics. Runs at exit, so failed runs are recorded too.
+    """
+    global _run
+    run, _run = _run, None
+    if run is None:
+        return
+    if run.profiler:
+        run.profiler.disable()
+        run.profiler.dump_stats(run.profile)
+    if run.metrics_json:
+        with open(run.metrics_json, 'w') as f:
+            json.dump(run.to_dict(), f, indent=2)
+
+@contextlib.contextmanager
+def phase(name):
+    """
+    Adds the time spent in the block to a phase; a phase can be entered repeatedly.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if _run is not None:
+            _run.phases[name] = _run.phases.get(name, 0.0) + time.perf_counter() - started
+
+def timed(iterable, name):
+    """
+    Yields the items of an iterable, adding the time spent producing them to a phase
+    (e.g. the parsing of chunks read with pandas).
+    """
+    iterator = iter(iterable)
+    while True:
+        with phase(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+def add(name, value=1):
+    """
+    Adds to a counter, e.g. rows, bytes_read or has_image_retries.
+    """
+    if _run is not None:
+        _run.counters[name] = _run.counters.get(name, 0) + value
+
+def add_file(name, path):
+    """
+    Adds the size of a file to a byte counter (bytes_read or bytes_written).
+    """
+    if _run is not None and path and os.path.isfile(path):
+        add(name, os.path.getsize(path))
+
+def observe(name, seconds):
+    """
+    Records a latency in a histogram with the LATENCY_BUCKETS bounds (the last bucket is unbounded).
+    """
+    if _run is None:
+        return
+    histogram = _run.histograms.setdefault(name, {'buckets': LATENCY_BUCKETS, 'counts': [0] * (len(LATENCY_BUCKETS) + 1),
+                                                  'count': 0, 'sum': 0.0, 'min': None, 'max': None})
+    histogram['counts'][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+    histogram['count'] += 1
+    histogram['sum'] = round(histogram['sum'] + seconds, 6)
+    histogram['min'] = seconds if histogram['min'] is None else min(histogram['min'], seconds)
+    histogram['max'] = seconds if histogram['max'] is None else max(histogram['max'], seconds)
+
+def add_arguments(parser):
+    """
+    Adds the --metrics_json and --profile options to a script's argument parser.
+    """
+    parser.add_argument('--metrics_json', required=False, help="Path to the output JSON file with the performance metrics of the run.")
+    parser.add_argument('--profile', required=False, help="Path to the output cProfile statistics; the run is profiled if given.")
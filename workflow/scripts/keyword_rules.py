@@ -0,0 +1,102 @@
+"""
+Script: keyword_rules.py
+Description: This module loads the declarative keyword rules for the text criteria and
+             evaluates them on whole columns with vectorized pandas string operations
+             (once per category for categorical columns).
+Input:
+    - rules_tsv: Path to the keyword rules TSV file (criterion, column, polarity, match, keyword).
+Output:
+    - Per-criterion 0/1 series, computed by assess_keyword_rule.
+"""
+
+import re
+import numpy as np
+import pandas as pd
+
+POLARITIES = {'include', 'exclude'}
+MATCH_TYPES = {'substring', 'exact'}
+RULE_COLUMNS = ['criterion', 'column', 'polarity', 'match', 'keyword']
+
+def load_keyword_rules(rules_tsv):
+    """
+    Loads and validates the keyword rules table. Returns a dict keyed by criterion
+    holding the input column and the compiled include/exclude matchers.
+    """
+    table = pd.read_csv(rules_tsv, sep='\t', dtype=str, keep_default_na=False)
+
+    if list(table.columns) != RULE_COLUMNS:
+        raise ValueError(f"Keyword rules must have the columns {' '.join(RULE_COLUMNS)}: {rules_tsv}")
+    if (table == '').any(axis=None):
+        raise ValueError(f"Keyword rules contain empty fields: {rules_tsv}")
+    if not table['polarity'].isin(POLARITIES).all():
+        raise ValueError(f"Keyword rule polarity must be one of {sorted(POLARITIES)}: {rules_tsv}")
+    if not table['match'].isin(MATCH_TYPES).all():
+        raise ValueError(f"Keyword rule match type must be one of {sorted(MATCH_TYPES)}: {rules_tsv}")
+    if table.duplicated().any():
+        raise ValueError(f"Keyword rules contain duplicate rows: {rules_tsv}")
+
+    rules = {}
+    for criterion, group in table.groupby('criterion', sort=False):
+        if group['column'].nunique() != 1:
+            raise ValueError(f"Keyword rules for {criterion} must read a single column.")
+        if group['match'].nunique() != 1:
+            raise ValueError(f"Keyword rules for {criterion} must use a single match type.")
+        match = group['match'].iloc[0]
+        include = group.loc[group['polarity'] == 'include', 'keyword'].tolist()
+        exclude = group.loc[group['polarity'] == 'exclude', 'keyword'].tolist()
+
+        if match == 'substring':
+            # Missing values never match; this only holds if no include keyword matches the text 'nan'
+            for keyword in include:
+                if keyword in 'nan':
+                    raise ValueError(f"Include keyword '{keyword}' for {criterion} would match missing values.")
+            # Text is lower-cased before matching, so a keyword with capitals could never match
+            for keyword in include + exclude:
+                if keyword != keyword.lower():
+                    raise ValueError(f"Substring keyword '{keyword}' for {criterion} must be lower case.")
+
+        rules[criterion] = {
+            'column': group['column'].iloc[0],
+            'match': match,
+            'include': compile_keywords(include) if match == 'substring' else include,
+            'exclude': compile_keywords(exclude) if match == 'substring' else exclude,
+        }
+    return rules
+
+def compile_keywords(keywords):
+    """
+    Compiles a list of keywords into a single alternation, or None if the list is empty.
+    """
+    if not keywords:
+        return None
+    # Longest first so the alternation never stops early on a shorter prefix
+    return re.compile('|'.join(re.escape(k) for k in sorted(set(keywords), key=len, reverse=True)))
+
+def assess_keyword_rule(series, rule):
+    """
+    Evaluates a keyword rule on a column: a record passes if it is not missing, matches
+    an include keyword (when there are any) and matches no exclude keyword. Categorical
+    columns are evaluated once per category.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Missing values have code -1, which picks the trailing 0
+        passed = np.append(assess_keyword_rule(pd.Series(series.cat.categories), rule).to_numpy(), 0)
+        return pd.Series(passed[series.cat.codes.to_numpy()], index=series.index)
+
+    present = series.notna()
+
+    if rule['match'] == 'exact':
+        passed = present
+        if rule['include']:
+            passed &= series.isin(rule['include'])
+        if rule['exclude']:
+            passed &= ~series.isin(rule['exclude'])
+        return passed.astype(int)
+
+    text = series.astype(str).str.lower()
+    passed = present
+    if rule['include'] is not None:
+        passed &= text.str.contains(rule['include'], na=False)
+    if rule['exclude'] is not None:
+        passed &= ~text.str.contains(rule['exclude'], na=False)
+    return passed.astype(int)
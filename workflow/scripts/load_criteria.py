@@ -1,64 +1,193 @@
 """
 Script: load_criteria.py
-Description: This script loads criteria data from a TSV file into the existing TSV file.
-Input: 
-    - criteria: String of criteria separated by spaces.
-    - bold_data_tsv: Path to the existing TSV file where criteria data will be appended.
-Output: 
-    - output_tsv: Path to the output TSV file containing the combined data.
+Description: This script ingests a BOLD data snapshot for the criteria stages. The snapshot is
+             streamed in chunks of bounded size and parsed with the pandas C parser. Lines with
+             the wrong number of fields, a carriage return inside a field, invalid UTF-8, a
+             missing record_id/processid or a non-numeric value in a numeric column are written
+             to a quarantine file together with their line number. Criterion columns are not
+             added here; they are filled in by the ranking_score stage. When a target list is
+             given, only the records of its taxa are kept, so no later stage processes the other
+             records.
+Input:
+    - bold_data_tsv: Path to the BOLD data snapshot TSV file.
+    - target_list: Optional CSV file with the target names and their synonyms.
+    - taxon_level: Column the target names are matched on (e.g. species).
+    - kingdom: Optional kingdom the records must belong to.
+    - memory_mb: Memory budget; sizes the chunks of the snapshot.
+Output:
+    - output_tsv: Path to the output TSV file containing the validated records.
+    - quarantine_tsv: Path to the TSV file with the rejected lines (line_number, reason, line).
+    - target_matches_tsv: Path to the TSV file mapping target names to the names matched in the data.
 """
 
-import pandas as pd
+import io
+import csv
 import argparse
 import logging
-import aiohttp
+import pandas as pd
+import instrumentation
+import memory_budget
+from target_list import read_target_list, match_targets, TargetMatches
+
+# Columns every record must have a value for
+REQUIRED_COLUMNS = ['processid', 'record_id']
 
-async def fetch_images(session, process_ids):
+# BCDM columns that must hold numbers when they are not empty
+NUMERIC_COLUMNS = ['nuc_basecount', 'elev', 'depth', 'coord_accuracy', 'elev_accuracy', 'depth_accuracy']
+
+CHUNK_BYTES = 64 * 1024 * 1024  # Largest input read per chunk; smaller if the memory budget requires
+
+def read_header(infile, required_columns=REQUIRED_COLUMNS):
+    """
+    Reads and checks the header line of the snapshot.
+    """
+    header = infile.readline().decode('utf-8-sig').rstrip('\r\n').split('\t')
+    missing = [column for column in required_columns if column not in header]
+    if missing:
+        logging.error(f"Columns not found in the input file: {' '.join(missing)}")
+        raise KeyError(f"Columns not found in the input file: {' '.join(missing)}")
+    return header
+
+def split_malformed(lines, first_line_number, n_fields):
+    """
+    Separates lines with the wrong number of fields, a carriage return inside a field or
+    invalid UTF-8 from the rest.
+    Returns the good lines with their line numbers and the rejected (line_number, reason, line).
+    """
     try:
-        async with session.get(BASE_URL + process_ids, timeout=aiohttp.ClientTimeout(total=60)) as response:
-            return await response.json()
-    except asyncio.TimeoutError:
-        logging.error(f"Timeout error for process_ids: {process_ids}")
-        return None
+        b''.join(lines).decode('utf-8')
+        valid_utf8 = True
+    except UnicodeDecodeError:
+        valid_utf8 = False
+
+    good_lines, good_numbers, rejected = [], [], []
+    for line_number, line in enumerate(lines, start=first_line_number):
+        fields = line.count(b'\t') + 1
+        if fields != n_fields:
+            rejected.append((line_number, f"expected {n_fields} fields, found {fields}", line))
+            continue
+        # The parser also breaks lines at a bare carriage return, which would split the record
+        if b'\r' in line.rstrip(b'\n').removesuffix(b'\r'):
+            rejected.append((line_number, "carriage return in field", line))
+            continue
+        if not valid_utf8:
+            try:
+                line.decode('utf-8')
+            except UnicodeDecodeError:
+                rejected.append((line_number, "invalid UTF-8", line))
+                continue
+        good_lines.append(line)
+        good_numbers.append(line_number)
+    return good_lines, good_numbers, rejected
 
-def load_criteria(criteria, bold_data_tsv, output_tsv):
+def validate_chunk(chunk):
     """
-    Loads criteria data from a TSV file into the existing TSV file.
+    Returns a series with the reason each record is invalid, or an empty string if it is valid.
     """
-    bad_lines = []
-
-    def bad_line_handler(line):
-        bad_lines.append(line)
-        return None
-
-    bold_data_df = pd.read_csv(bold_data_tsv, sep='\t', on_bad_lines=bad_line_handler, engine='python')
-    
-    for criterion in criteria.split():
-        bold_data_df[criterion] = bold_data_df.apply(lambda row: apply_criterion(row, criterion), axis=1)
-    
-    bold_data_df.to_csv(output_tsv, sep='\t', index=False)
-    
-    if bad_lines:
-        logging.warning(f"Skipped {len(bad_lines)} bad lines:")
-        for line in bad_lines:
-            logging.warning(line)
-
-def apply_criterion(row, criterion):
+    reasons = pd.Series('', index=chunk.index)
+    for column in NUMERIC_COLUMNS:
+        if column in chunk.columns:
+            values = chunk[column]
+            invalid = (values != '') & pd.to_numeric(values, errors='coerce').isna()
+            reasons[invalid] = f"non-numeric {column}"
+    for column in REQUIRED_COLUMNS:
+        reasons[chunk[column] == ''] = f"missing {column}"
+    return reasons
+
+def load_criteria(bold_data_tsv, output_tsv, quarantine_tsv, chunk_bytes=CHUNK_BYTES,
+                  target_list=None, taxon_level='species', kingdom=None, target_matches_tsv=None,
+                  memory_mb=memory_budget.DEFAULT_MEMORY_MB):
     """
-    Applies a single criterion to a row of BOLD data.
-    This is a placeholder function and should be replaced with actual logic.
+    Streams the snapshot into a validated TSV file and quarantines malformed lines.
+    With a target list, records of other taxa are dropped before they are validated.
     """
-    # Placeholder logic: Add a new column with the criterion name and set it to 1
-    return 1
+    chunk_bytes = memory_budget.chunk_bytes(memory_mb, memory_budget.FULL_ROW_EXPANSION, limit=chunk_bytes)
+    total = written = non_target = 0
+    index = read_target_list(target_list, taxon_level) if target_list else None
+    matches = TargetMatches()
+    with open(bold_data_tsv, 'rb') as infile, open(quarantine_tsv, 'w', encoding='utf-8', newline='') as quarantine_file:
+        quarantine = csv.writer(quarantine_file, delimiter='\t', lineterminator='\n')
+        quarantine.writerow(['line_number', 'reason', 'line'])
+
+        required_columns = REQUIRED_COLUMNS + ([taxon_level] + (['kingdom'] if kingdom else []) if index is not None else [])
+        header = read_header(infile, required_columns)
+        line_number = 2
+        first = True
+        while True:
+            with instrumentation.phase('parse'):
+                lines = infile.readlines(chunk_bytes)
+                if not lines:
+                    break
+                chunk_start = line_number
+                good_lines, good_numbers, rejected = split_malformed(lines, line_number, len(header))
+                line_number += len(lines)
+                total += len(lines)
+
+                # Every field is kept as text, so values are written back exactly as read
+                if good_lines:
+                    chunk = pd.read_csv(io.BytesIO(b''.join(good_lines)), sep='\t', header=None, names=header, dtype=str,
+                                        keep_default_na=False, quoting=csv.QUOTE_NONE, engine='c')
+                else:
+                    chunk = pd.DataFrame(columns=header, dtype=str)
+                chunk.index = good_numbers
+
+            if index is not None:
+                with instrumentation.phase('filter'):
+                    targets = match_targets(chunk, index, taxon_level, kingdom)
+                    matches.add(chunk, targets, taxon_level)
+                    non_target += int(targets.isna().sum())
+                    chunk = chunk[targets.notna()]
+
+            with instrumentation.phase('evaluate'):
+                reasons = validate_chunk(chunk)
+                invalid = reasons != ''
+                rejected.extend((number, reason, lines[number - chunk_start]) for number, reason in reasons[invalid].items())
+
+            with instrumentation.phase('write'):
+                for number, reason, line in sorted(rejected, key=lambda r: r[0]):
+                    quarantine.writerow([number, reason, line.decode('utf-8', errors='replace').rstrip('\r\n')])
+                chunk[~invalid].to_csv(output_tsv, sep='\t', index=False, mode='w' if first else 'a', header=first)
+            written += int((~invalid).sum())
+            first = False
+
+        if first:
+            pd.DataFrame(columns=header).to_csv(output_tsv, sep='\t', index=False)
+
+    if index is not None:
+        if target_matches_tsv:
+            matches.write(target_matches_tsv)
+            instrumentation.add_file('bytes_written', target_matches_tsv)
+        instrumentation.add('non_target', non_target)
+        logging.info(f"Dropped {non_target} records of taxa not on the target list {target_list}")
+
+    quarantined = total - written - non_target
+    instrumentation.add('rows', total)
+    instrumentation.add('quarantined', quarantined)
+    instrumentation.add_file('bytes_read', bold_data_tsv)
+    instrumentation.add_file('bytes_written', output_tsv)
+    instrumentation.add_file('bytes_written', quarantine_tsv)
+
+    if quarantined:
+        logging.warning(f"Quarantined {quarantined} of {total} lines in {quarantine_tsv}")
+    logging.info(f"Loaded {written} records from {bold_data_tsv}")
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Load criteria data into the existing BOLD data TSV file.")
-    parser.add_argument('--bold_data_tsv', required=True, help="Path to the existing BOLD data TSV file.")
-    parser.add_argument('--criteria', required=True, help="String of criteria separated by spaces.")
-    parser.add_argument('--output_tsv', required=True, help="Path to the output TSV file containing the combined data.")
+    parser = argparse.ArgumentParser(description="Ingest a BOLD data snapshot, quarantining malformed lines.")
+    parser.add_argument('--bold_data_tsv', required=True, help="Path to the BOLD data snapshot TSV file.")
+    parser.add_argument('--output_tsv', required=True, help="Path to the output TSV file containing the validated records.")
+    parser.add_argument('--quarantine_tsv', required=True, help="Path to the output TSV file with the rejected lines.")
+    parser.add_argument('--target_list', required=False, help="Path to the CSV file with the target names and their synonyms; only their records are kept.")
+    parser.add_argument('--taxon_level', default='species', help="Column the target names are matched on (e.g. species or genus).")
+    parser.add_argument('--kingdom', required=False, help="Kingdom the target records must belong to (e.g. Animalia).")
+    parser.add_argument('--target_matches_tsv', required=False, help="Path to the output TSV file mapping target names to the names matched in the data.")
+    memory_budget.add_arguments(parser)
     parser.add_argument('--log_file', required=False, help="Path to the log file.")
+    instrumentation.add_arguments(parser)
     args = parser.parse_args()
 
-    logging.basicConfig(filename=args.log_file, level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    logging.basicConfig(filename=args.log_file, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    instrumentation.start('load_criteria', args.metrics_json, args.profile)
 
-    load_criteria(args.criteria, args.bold_data_tsv, args.output_tsv)
\ No newline at end of file
+    load_criteria(args.bold_data_tsv, args.output_tsv, args.quarantine_tsv, target_list=args.target_list,
+                  taxon_level=args.taxon_level, kingdom=args.kingdom, target_matches_tsv=args.target_matches_tsv,
+                  memory_mb=args.memory_mb)
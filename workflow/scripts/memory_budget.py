@@ -0,0 +1,59 @@
+"""
+Script: memory_budget.py
+Description: This module turns the memory budget of a pipeline stage (MEMORY_MB in the config)
+             into chunk sizes. Stages that stream their input size each chunk so that the
+             chunks in memory at the same time, once parsed, fit in the budget; everything
+             else is written to disk as it is produced. The expansion of a chunk is the
+             memory it takes once parsed, relative to its size in the input file.
+Input:
+    - memory_mb: Memory budget of the stage in MB.
+Output:
+    - Chunk sizes in bytes of input, or in rows of a given input file.
+"""
+
+DEFAULT_MEMORY_MB = 4000
+
+# Memory used by the interpreter, pandas and NumPy before any data is read
+BASE_MB = 250
+
+# Expansion of a chunk read with every column as text, and of a chunk read with only a few columns
+FULL_ROW_EXPANSION = 4
+PROJECTED_EXPANSION = 3
+
+MIN_CHUNK_BYTES = 1024 * 1024
+MIN_CHUNK_ROWS = 1000
+
+def chunk_bytes(memory_mb, expansion, chunks=1, limit=None):
+    """
+    Returns the number of input bytes per chunk such that `chunks` chunks fit in the budget
+    (e.g. one per worker process), optionally capped at `limit`.
+    """
+    size = int((max(memory_mb - BASE_MB, 0) * 1024 * 1024) / (expansion * max(chunks, 1)))
+    if limit:
+        size = min(size, limit)
+    return max(size, MIN_CHUNK_BYTES)
+
+def bytes_per_row(path, sample_bytes=1024 * 1024):
+    """
+    Estimates the average size of a record in a TSV file with a header line from its first records.
+    """
+    with open(path, 'rb') as f:
+        f.readline()
+        sample = f.read(sample_bytes)
+    return max(len(sample) / max(sample.count(b'\n'), 1), 1)
+
+def chunk_rows(path, memory_mb, expansion, chunks=1, limit=None):
+    """
+    Returns the number of records of a TSV file per chunk such that `chunks` chunks fit in
+    the budget, optionally capped at `limit` records.
+    """
+    rows = int(chunk_bytes(memory_mb, expansion, chunks) / bytes_per_row(path))
+    if limit:
+        rows = min(rows, limit)
+    return max(rows, MIN_CHUNK_ROWS)
+
+def add_arguments(parser):
+    """
+    Adds the --memory_mb option to a script's argument parser.
+    """
+    parser.add_argument('--memory_mb', type=int, default=DEFAULT_MEMORY_MB, help="Memory budget of the stage in MB; inputs are processed in chunks that fit in it.")
@@ -0,0 +1,57 @@
+"""
+Script: mock_image_api.py
+Description: This script runs a local stand-in for the caos.boldsystems.org images API, so
+             that HAS_IMAGE can be benchmarked and checked offline. Whether a process ID has
+             an image is derived from a hash of the ID, so results are reproducible and can be
+             verified with has_image_expected.
+Input:
+    - port: Port to listen on.
+    - image_rate: Fraction of process IDs that have an image.
+    - latency: Delay in seconds added to every response.
+    - failure_rate: Fraction of requests answered with HTTP 503, to exercise retries.
+Output:
+    - Serves GET /api/images?processids=<id>,<id>,... with a JSON list of image records.
+      Point access_criteria.py at it with --image_api_url http://localhost:<port>/api/images?processids=
+"""
+
+import random
+import asyncio
+import hashlib
+import argparse
+from aiohttp import web
+
+def has_image_expected(processid, image_rate):
+    """
+    Returns whether the mock API reports an image for the given process ID.
+    """
+    digest = hashlib.md5(processid.encode()).digest()
+    return int.from_bytes(digest[:4], 'big') < image_rate * 2 ** 32
+
+def create_app(image_rate=0.5, latency=0.0, failure_rate=0.0):
+    """
+    Creates the mock images API application.
+    """
+    async def images(request):
+        if latency:
+            await asyncio.sleep(latency)
+        if failure_rate and random.random() < failure_rate:
+            raise web.HTTPServiceUnavailable()
+        process_ids = [pid for pid in request.query.get('processids', '').split(',') if pid]
+        return web.json_response([
+            {'processid': pid, 'objectid': hashlib.md5(pid.encode()).hexdigest()}
+            for pid in process_ids if has_image_expected(pid, image_rate)
+        ])
+
+    app = web.Application()
+    app.router.add_get('/api/images', images)
+    return app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the BOLD images API.")
+    parser.add_argument('--port', type=int, default=8080, help="Port to listen on.")
+    parser.add_argument('--image_rate', type=float, default=0.5, help="Fraction of process IDs that have an image.")
+    parser.add_argument('--latency', type=float, default=0.0, help="Delay in seconds added to every response.")
+    parser.add_argument('--failure_rate', type=float, default=0.0, help="Fraction of requests answered with HTTP 503.")
+    args = parser.parse_args()
+
+    web.run_app(create_app(args.image_rate, args.latency, args.failure_rate), host='127.0.0.1', port=args.port)
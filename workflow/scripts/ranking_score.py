@@ -1,74 +1,280 @@
+import numpy as np
 import pandas as pd
 import argparse
+import csv
+import heapq
+import logging
 import os
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from columnar import column_path, open_manifest, write_manifest, UNKNOWN
+from filter_tsv import CRITERIA_TSV, read_criteria_names
+import instrumentation
+import memory_budget
 
-def ranking_score(db_file, criteria_file, output_path):
+# Declarative tier definitions: each tier lists required criteria, '|' separates alternatives
+RANKING_TIERS_TSV = 'resources/ranking_tiers.tsv'
+
+CHUNK_SIZE = 10000  # Largest number of records per chunk; fewer if the memory budget requires
+
+def load_ranking_tiers(tiers_tsv, criteria_tsv=CRITERIA_TSV):
+    """
+    Loads the ranking tiers. Returns the tiers in rank order as (rank, clauses) pairs,
+    where each clause is a list of alternative criteria, and the criteria in bit order.
+    Every criterion must be defined in the criteria TSV file, which also bounds the size
+    of the rank lookup table.
+    """
+    tiers_df = pd.read_csv(tiers_tsv, sep='\t', dtype={'rank': int, 'requirements': str})
+    if list(tiers_df.columns) != ['rank', 'requirements']:
+        raise ValueError(f"Ranking tiers must have the columns rank and requirements: {tiers_tsv}")
+    if tiers_df['requirements'].isnull().any() or (tiers_df['rank'] <= 0).any() or tiers_df['rank'].duplicated().any():
+        raise ValueError(f"Ranking tiers need unique positive ranks and non-empty requirements: {tiers_tsv}")
+
+    known = set(read_criteria_names(criteria_tsv))
+    tiers = []
+    criteria = []
+    for row in tiers_df.sort_values('rank').itertuples():
+        clauses = [term.split('|') for term in row.requirements.split()]
+        unknown = [criterion for clause in clauses for criterion in clause if criterion not in known]
+        if unknown:
+            raise ValueError(f"Ranking tier {row.rank} requires criteria not defined in {criteria_tsv}: {' '.join(unknown)}")
+        for criterion in (c for clause in clauses for c in clause):
+            if criterion not in criteria:
+                criteria.append(criterion)
+        tiers.append((row.rank, clauses))
+    return tiers, criteria
+
+def build_rank_lookup(tiers, criteria):
+    """
+    Builds a table mapping every bitmask of the criteria to its rank (0 if no tier applies).
+    """
+    masks = np.arange(2 ** len(criteria), dtype=np.int64)
+    lookup = np.zeros(len(masks), dtype=np.int64)
+    for rank, clauses in tiers:
+        satisfied = lookup == 0
+        for clause in clauses:
+            alternatives = sum(1 << criteria.index(criterion) for criterion in clause)
+            satisfied &= (masks & alternatives) != 0
+        lookup[satisfied] = rank
+    return lookup
+
+def calculate_rankings(df, criteria, lookup):
+    """
+    Packs the criteria of each record into a bitmask and looks up its rank.
+    Missing criteria columns and values other than 1 count as not met.
+    """
+    bitmask = np.zeros(len(df), dtype=np.int64)
+    for bit, criterion in enumerate(criteria):
+        if criterion in df.columns:
+            bitmask |= (df[criterion] == 1).fillna(False).to_numpy(dtype=np.int64) << bit
+    return lookup[bitmask]
+
+class AlignmentError(ValueError):
+    """
+    Raised when the concatenated criteria are not in the same record order as the records.
+    """
+
+def read_result_chunks(db_file, chunk_size):
+    """
+    Streams the concatenated criteria TSV file with nullable int8 criterion columns.
+    """
+    columns = pd.read_csv(db_file, sep='\t', nrows=0).columns
+    dtypes = {column: 'Int8' for column in columns if column != 'record_id'}
+    return pd.read_csv(db_file, sep='\t', dtype={'record_id': str, **dtypes}, keep_default_na=False, chunksize=chunk_size)
+
+def read_manifest_chunks(db_file, chunk_size):
+    """
+    Yields the memory-mapped criterion columns of a manifest in chunks of rows.
+    """
+    rows, columns = open_manifest(db_file)
+    for start in range(0, rows, chunk_size):
+        yield pd.DataFrame({criterion: pd.arrays.IntegerArray(values, values == UNKNOWN)
+                            for criterion, values in ((c, np.array(column[start:start + chunk_size])) for c, column in columns.items())})
+
+def positional_join(criteria_file, result_chunks, chunk_size):
+    """
+    Pairs each chunk of records with the criteria at the same row positions. The
+    record_ids of both sides are compared when the criteria carry them. The records are
+    kept as text, so their fields are written out exactly as read whatever the chunk size.
+    """
+    result_chunks = instrumentation.timed(result_chunks, 'parse')
+    for records in instrumentation.timed(pd.read_csv(criteria_file, sep='\t', dtype=str, keep_default_na=False, chunksize=chunk_size), 'parse'):
+        results = next(result_chunks, None)
+        with instrumentation.phase('join'):
+            if results is None or len(results) != len(records):
+                raise AlignmentError(f"The criteria have fewer rows than {criteria_file}.")
+            if 'record_id' in results.columns:
+                if not np.array_equal(results['record_id'].to_numpy(), records['record_id'].to_numpy()):
+                    raise AlignmentError("The criteria are not in the same record order as the records.")
+                results = results.drop(columns='record_id')
+            for column in results.columns:
+                records[column] = results[column].array
+        yield records
+    if next(result_chunks, None) is not None:
+        raise AlignmentError(f"The criteria have more rows than {criteria_file}.")
+
+def write_sorted_runs(chunks, directory, prefix):
+    """
+    Sorts each chunk by record_id and writes it to its own run file.
+    """
+    paths = []
+    for i, chunk in enumerate(chunks):
+        path = os.path.join(directory, f"{prefix}_{i}.tsv")
+        chunk.sort_values('record_id', kind='stable').to_csv(path, sep='\t', index=False, header=False)
+        paths.append(path)
+    return paths
+
+def read_run(path):
+    """
+    Yields the rows of a sorted run file.
+    """
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        yield from csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE)
+
+def write_record_runs(records_tsv, directory, run_size, values=()):
+    """
+    Writes sorted runs of the record_ids of a TSV file, followed by the given columns and the
+    row position of each record. Returns the run paths and the number of records.
+    """
+    columns = ['record_id', *values]
+    positions = []
+    def record_chunks():
+        for chunk in pd.read_csv(records_tsv, sep='\t', usecols=columns, dtype=str, keep_default_na=False, chunksize=run_size):
+            yield chunk[columns].assign(position=np.arange(sum(positions), sum(positions) + len(chunk)))
+            positions.append(len(chunk))
+    runs = write_sorted_runs(record_chunks(), directory, 'records')
+    return runs, sum(positions)
+
+def join_runs(result_runs, record_runs, columns):
+    """
+    Merges sorted runs of (record_id, values) with sorted runs of (record_id, position) and
+    writes the values of each record into the columns at its row position. Records without
+    values keep what the columns hold; of several rows with the same record_id, the first is used.
+    """
+    by_record_id = lambda row: row[0]
+    results = heapq.merge(*(read_run(path) for path in result_runs), key=by_record_id)
+    current = next(results, None)
+    for record_id, position in heapq.merge(*(read_run(path) for path in record_runs), key=by_record_id):
+        while current is not None and current[0] < record_id:
+            current = next(results, None)
+        if current is not None and current[0] == record_id:
+            for column, value in zip(columns, current[1:]):
+                column[int(position)] = int(value)
+
+def external_merge(db_file, criteria_file, directory, run_size):
+    """
+    Joins the concatenated criteria to the records by record_id with an external sort-merge,
+    writing the criteria as columnar arrays in the records' row order. Each sorted run holds
+    run_size records. Returns the manifest path.
+    """
+    criteria = [column for column in pd.read_csv(db_file, sep='\t', nrows=0).columns if column != 'record_id']
+
+    # Sorted runs of (record_id, criteria) and (record_id, row position)
+    with instrumentation.phase('sort'):
+        result_runs = write_sorted_runs((chunk.fillna(UNKNOWN) for chunk in read_result_chunks(db_file, run_size)), directory, 'criteria')
+        record_runs, rows = write_record_runs(criteria_file, directory, run_size)
+
+    column_paths = [column_path(directory, criterion) for criterion in criteria]
+    columns = [np.lib.format.open_memmap(path, mode='w+', dtype=np.int8, shape=(rows,)) for path in column_paths]
+    for column in columns:
+        column[:] = UNKNOWN
+
+    # Merge both sorted streams; records without criteria stay UNKNOWN
+    with instrumentation.phase('join'):
+        join_runs(result_runs, record_runs, columns)
+        for column in columns:
+            column.flush()
+
+    manifest_path = os.path.join(directory, 'concatenated.json')
+    write_manifest(column_paths, manifest_path)
+    return manifest_path
+
+def rank_chunk(chunk, criteria, lookup, header):
+    """
+    Ranks a chunk of records and returns it as TSV text.
+    """
+    with instrumentation.phase('evaluate'):
+        chunk['ranking'] = calculate_rankings(chunk, criteria, lookup)
+    with instrumentation.phase('write'):
+        return chunk.to_csv(sep='\t', index=False, header=header)
+
+def write_ranked(chunks, output_path, criteria, lookup, workers):
+    """
+    Ranks the chunks in a process pool and writes them in their original order.
+    At most twice as many chunks as workers are in flight. Returns the number of records.
+    """
+    rows = 0
+    with open(output_path, 'w', encoding='utf-8', newline='') as outfile:
+        if workers <= 1:
+            for i, chunk in enumerate(chunks):
+                outfile.write(rank_chunk(chunk, criteria, lookup, i == 0))
+                rows += len(chunk)
+            return rows
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for i, chunk in enumerate(chunks):
+                pending.append(executor.submit(rank_chunk, chunk, criteria, lookup, i == 0))
+                rows += len(chunk)
+                if len(pending) >= 2 * workers:
+                    outfile.write(pending.popleft().result())
+            while pending:
+                outfile.write(pending.popleft().result())
+    return rows
+
+def ranking_score(db_file, criteria_file, output_path, tiers_tsv=RANKING_TIERS_TSV, workers=1, chunk_size=CHUNK_SIZE,
+                  memory_mb=memory_budget.DEFAULT_MEMORY_MB, criteria_tsv=CRITERIA_TSV):
     """
     Substitutes the criteria columns, calculates the ranking score, and generates a final output file.
+    Both inputs are streamed and joined by row position; if the concatenated TSV file turns out
+    not to be in the records' order, it is joined by record_id with an external sort-merge instead.
+    The chunks in flight and the sorted runs of the merge fit in the memory budget.
     """
-    # Define the chunk size for processing
-    chunk_size = 10000
+    tiers, tier_criteria = load_ranking_tiers(tiers_tsv, criteria_tsv)
+    lookup = build_rank_lookup(tiers, tier_criteria)
+    # Up to twice as many chunks as workers are queued, besides the one being read
+    chunk_size = memory_budget.chunk_rows(criteria_file, memory_mb, memory_budget.FULL_ROW_EXPANSION, chunks=2 * workers + 1, limit=chunk_size)
+
+    # The columnar backend provides a manifest of int8 arrays aligned by row position
+    if db_file.endswith('.json'):
+        rows = write_ranked(positional_join(criteria_file, read_manifest_chunks(db_file, chunk_size), chunk_size),
+                            output_path, tier_criteria, lookup, workers)
+        instrumentation.add('rows', rows)
+        return
 
-    # First, load the concatenated file (which should be smaller) into memory
     try:
-        concatenated_df = pd.read_csv(db_file, sep='\t', low_memory=False)
-    except MemoryError:
-        raise MemoryError("The concatenated file is too large to load into memory. Consider increasing available memory.")
-
-    # Remove the output file if it exists
-    if os.path.exists(output_path):
-        os.remove(output_path)
-
-    # Process the criteria file in chunks
-    header_written = False
-    for criteria_chunk in pd.read_csv(criteria_file, sep='\t', chunksize=chunk_size, low_memory=False):
-        # Merge the current chunk with the concatenated dataframe
-        temp_merged_df = pd.merge(criteria_chunk, concatenated_df, on='record_id', how='left', suffixes=('', '_new'))
-
-        # Substitute the criteria columns with the new values
-        criteria_columns = [col for col in concatenated_df.columns if col != 'record_id']
-        for column in criteria_columns:
-            if f"{column}_new" in temp_merged_df.columns:
-                temp_merged_df[column] = temp_merged_df[f"{column}_new"]
-                temp_merged_df.drop(columns=[f"{column}_new"], inplace=True)
-
-        # Apply the ranking system
-        def calculate_ranking(row):
-            if row.get('SPECIES_ID') == 1:
-                if row.get('TYPE_SPECIMEN') == 1:
-                    return 1
-                elif (row.get('SEQ_QUALITY') == 1 and row.get('HAS_IMAGE') == 1 and row.get('COLLECTORS') == 1 and
-                      row.get('COLLECTION_DATE') == 1 and row.get('COUNTRY') == 1 and row.get('SITE') == 1 and row.get('COORD') == 1 and
-                      row.get('IDENTIFIER') == 1 and (row.get('ID_METHOD') == 1 or row.get('INSTITUTION') == 1) and
-                      (row.get('PUBLIC_VOUCHER') == 1 or row.get('MUSEUM_ID') == 1)):
-                    return 2
-                elif (row.get('SEQ_QUALITY') == 1 and row.get('HAS_IMAGE') == 1 and row.get('COUNTRY') == 1 and
-                      (row.get('IDENTIFIER') == 1 or row.get('ID_METHOD') == 1) and
-                      (row.get('INSTITUTION') == 1 or row.get('PUBLIC_VOUCHER') == 1 or row.get('MUSEUM_ID') == 1)):
-                    return 3
-                elif row.get('SEQ_QUALITY') == 1 and row.get('HAS_IMAGE') == 1 and row.get('COUNTRY') == 1:
-                    return 4
-                elif row.get('SEQ_QUALITY') == 1 and row.get('HAS_IMAGE') == 1:
-                    return 5
-                elif row.get('SEQ_QUALITY') == 1:
-                    return 6
-            return None
-
-        temp_merged_df['ranking'] = temp_merged_df.apply(calculate_ranking, axis=1)
-        temp_merged_df['ranking'] = temp_merged_df['ranking'].fillna(0).astype('int')  # Fill NaN values with 0 and convert to integer
-
-        # Write the chunk to the output file
-        if not header_written:
-            temp_merged_df.to_csv(output_path, sep='\t', index=False, mode='w')
-            header_written = True
-        else:
-            temp_merged_df.to_csv(output_path, sep='\t', index=False, mode='a', header=False)
+        rows = write_ranked(positional_join(criteria_file, read_result_chunks(db_file, chunk_size), chunk_size),
+                            output_path, tier_criteria, lookup, workers)
+    except AlignmentError as e:
+        logging.warning(f"{e} Falling back to a sort-merge join on record_id.")
+        instrumentation.add('sort_merge_fallbacks')
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output_path))) as directory:
+            # Runs as large as the budget allows, so few run files are open while merging
+            run_size = memory_budget.chunk_rows(db_file, memory_mb, memory_budget.PROJECTED_EXPANSION)
+            manifest_path = external_merge(db_file, criteria_file, directory, run_size)
+            rows = write_ranked(positional_join(criteria_file, read_manifest_chunks(manifest_path, chunk_size), chunk_size),
+                                output_path, tier_criteria, lookup, workers)
+    instrumentation.add('rows', rows)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Substitute the criteria columns, calculate the ranking score, and generate a final output file.")
-    parser.add_argument('--db_file', required=True, help="Path to the input TSV file containing the concatenated records.")
+    parser.add_argument('--db_file', required=True, help="Path to the input TSV file containing the concatenated records, or the JSON manifest of the columnar backend.")
     parser.add_argument('--criteria_file', required=True, help="Path to the TSV file containing the criteria.")
     parser.add_argument('--output_path', required=True, help="Path to the output TSV file.")
+    parser.add_argument('--ranking_tiers', required=False, default=RANKING_TIERS_TSV, help="Path to the TSV file defining the ranking tiers.")
+    parser.add_argument('--criteria_tsv', required=False, default=CRITERIA_TSV, help="Path to the criteria TSV file; the ranking tiers may only require these criteria.")
+    parser.add_argument('--workers', type=int, default=1, help="Number of worker processes ranking chunks.")
+    memory_budget.add_arguments(parser)
+    parser.add_argument('--log_file', required=False, help="Path to the log file.")
+    instrumentation.add_arguments(parser)
     args = parser.parse_args()
 
-    ranking_score(args.db_file, args.criteria_file, args.output_path)
\ No newline at end of file
+    logging.basicConfig(filename=args.log_file, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    instrumentation.start('ranking_score', args.metrics_json, args.profile)
+
+    ranking_score(args.db_file, args.criteria_file, args.output_path, args.ranking_tiers, args.workers, memory_mb=args.memory_mb,
+                  criteria_tsv=args.criteria_tsv)
+    for path in (args.db_file, args.criteria_file):
+        instrumentation.add_file('bytes_read', path)
+    instrumentation.add_file('bytes_written', args.output_path)
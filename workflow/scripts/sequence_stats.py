@@ -0,0 +1,115 @@
+"""
+Script: sequence_stats.py
+Description: This module computes nucleotide statistics for the SEQ_QUALITY criterion in
+             batches. The sequences of a batch are joined into one contiguous byte buffer with
+             record offsets, every byte is classified with a lookup table, and the statistics
+             are reduced per record with NumPy from the positions of the bytes that are not
+             unambiguous bases: the unaligned length (gaps excluded), the number of ambiguous
+             bases (N and the other IUPAC codes), the internal gap runs, and the leading and
+             trailing gaps. A sequence passes SEQ_QUALITY if it is long enough and
+             has few ambiguities (and optionally few gap runs).
+Input:
+    - nuc: Series of aligned nucleotide sequences (missing values have no sequence).
+    - thresholds: min_length, max_ambiguity (fraction of the unaligned length) and max_gap_runs.
+Output:
+    - DataFrame with the statistics per record, and the 0/1 SEQ_QUALITY series.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Records per batch; bounds the size of the byte buffer and the per-byte temporaries
+BATCH_RECORDS = 10000
+
+# Thresholds of the SEQ_QUALITY criterion: longer than min_length bases, at most max_ambiguity
+# ambiguous bases per base, and at most max_gap_runs internal gap runs (None: no limit)
+THRESHOLDS = {'min_length': 500, 'max_ambiguity': 0.01, 'max_gap_runs': None}
+
+STATS_COLUMNS = ['seq_length', 'seq_ambiguities', 'seq_n', 'seq_gap_runs', 'seq_leading_gaps', 'seq_trailing_gaps']
+
+# Byte classes, as a bytes.translate table: unambiguous bases, gaps, N, and everything else
+# (other IUPAC codes or invalid characters). Bases are 0, so the other bytes are found with one scan.
+BASE, GAP, N, AMBIGUOUS = 0, 1, 2, 3
+BYTE_CLASSES = bytearray([AMBIGUOUS]) * 256
+for base in b'ACGTUacgtu':
+    BYTE_CLASSES[base] = BASE
+BYTE_CLASSES[ord('-')] = GAP
+BYTE_CLASSES[ord('N')] = BYTE_CLASSES[ord('n')] = N
+BYTE_CLASSES = bytes(BYTE_CLASSES)
+
+def encode_sequences(sequences):
+    """
+    Joins the sequences into one byte buffer. Returns the buffer and the offsets of the
+    records in it (record i is buffer[offsets[i]:offsets[i + 1]]); non-ASCII characters
+    take one byte each, so they count as ambiguous bases.
+    """
+    texts = [value if isinstance(value, str) else '' for value in sequences.to_numpy(dtype=object)]
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    np.cumsum(np.fromiter(map(len, texts), dtype=np.int64, count=len(texts)), out=offsets[1:])
+    return ''.join(texts).encode('ascii', errors='replace'), offsets
+
+def counts_per_record(positions, offsets):
+    """
+    Counts sorted buffer positions per record.
+    """
+    return np.diff(np.searchsorted(positions, offsets))
+
+def buffer_stats(buffer, offsets):
+    """
+    Computes the statistics of the records in a byte buffer. Only the positions of the
+    bytes that are not unambiguous bases are kept, so all later steps work on those.
+    """
+    classes = np.frombuffer(buffer.translate(BYTE_CLASSES), dtype=np.uint8)
+    positions = np.flatnonzero(classes.view(bool))
+    kinds = classes[positions]
+    gaps = positions[kinds == GAP]
+    gaps_per_record = counts_per_record(gaps, offsets)
+    length = np.diff(offsets) - gaps_per_record
+    has_bases = length > 0
+
+    # Runs of consecutive gaps within a record; a run at the start or end of a record with
+    # bases is a leading or trailing gap, the others are internal gap runs
+    n_records = len(offsets) - 1
+    record = np.repeat(np.arange(n_records), gaps_per_record)
+    new_run = np.ones(len(gaps), dtype=bool)
+    new_run[1:] = (gaps[1:] != gaps[:-1] + 1) | (record[1:] != record[:-1])
+    run_index = np.flatnonzero(new_run)
+    run_start, run_record = gaps[run_index], record[run_index]
+    run_length = np.diff(np.append(run_index, len(gaps)))
+
+    leading = np.zeros(n_records, dtype=np.int64)
+    trailing = np.zeros(n_records, dtype=np.int64)
+    at_start = run_start == offsets[run_record]
+    leading[run_record[at_start]] = run_length[at_start]
+    at_end = (run_start + run_length == offsets[run_record + 1]) & has_bases[run_record]
+    trailing[run_record[at_end]] = run_length[at_end]
+    gap_runs = np.bincount(run_record, minlength=n_records) - (leading > 0) - (trailing > 0)
+
+    return {
+        'seq_length': length,
+        'seq_ambiguities': counts_per_record(positions[kinds != GAP], offsets),
+        'seq_n': counts_per_record(positions[kinds == N], offsets),
+        'seq_gap_runs': np.where(has_bases, gap_runs, 0),
+        'seq_leading_gaps': leading,
+        'seq_trailing_gaps': trailing,
+    }
+
+def sequence_stats(sequences, batch_records=BATCH_RECORDS):
+    """
+    Computes the statistics of a series of sequences, batch by batch.
+    """
+    batches = [buffer_stats(*encode_sequences(sequences.iloc[i:i + batch_records]))
+               for i in range(0, len(sequences), batch_records)]
+    return pd.DataFrame({column: np.concatenate([batch[column] for batch in batches]) if batches else np.zeros(0, dtype=np.int64)
+                         for column in STATS_COLUMNS}, index=sequences.index)
+
+def assess_sequence_quality(stats, thresholds=THRESHOLDS):
+    """
+    Returns SEQ_QUALITY as a 0/1 series: the sequence is longer than min_length bases and has
+    at most max_ambiguity ambiguous bases per base (and at most max_gap_runs gap runs).
+    """
+    passed = (stats['seq_length'] > thresholds['min_length']) & \
+             (stats['seq_ambiguities'] <= thresholds['max_ambiguity'] * stats['seq_length'])
+    if thresholds.get('max_gap_runs') is not None:
+        passed &= stats['seq_gap_runs'] <= thresholds['max_gap_runs']
+    return passed.astype(int)
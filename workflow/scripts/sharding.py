@@ -0,0 +1,118 @@
+"""
+Script: sharding.py
+Description: This module splits a BOLD data TSV file into record-aligned byte-range shards
+             without rewriting it, so the criteria can be assessed per shard in a process pool
+             or as separate Snakemake jobs. Shard outputs are concatenated back in shard order.
+Commands:
+    - merge: Concatenates the shard outputs (TSV files, or directories of .npy columns).
+Input:
+    - inputs: Shard outputs in shard order.
+    - criteria: String of criteria separated by spaces (columnar shard outputs).
+Output:
+    - output: Concatenated TSV file, or directory for the concatenated .npy columns.
+"""
+
+import os
+import shutil
+import argparse
+import logging
+import numpy as np
+import instrumentation
+from columnar import column_path, open_column
+
+def parse_shard(value):
+    """
+    Parses a shard specification of the form INDEX/COUNT (INDEX starts at 0).
+    """
+    index, count = (int(part) for part in value.split('/'))
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard: {value}")
+    return index, count
+
+def shard_ranges(path, count, byte_range=None):
+    """
+    Splits the records of a TSV file (or of a byte range of it) into `count` byte ranges
+    aligned to line starts. Ranges may be empty for small files, so every shard index
+    always exists.
+    """
+    with open(path, 'rb') as infile:
+        start, end = byte_range or (len(infile.readline()), os.path.getsize(path))
+        boundaries = [start]
+        for i in range(1, count):
+            infile.seek(max(start, start + (end - start) * i // count) - 1)
+            infile.readline()
+            boundaries.append(max(boundaries[-1], min(infile.tell(), end)))
+    boundaries.append(end)
+    return [(boundaries[i], boundaries[i + 1]) for i in range(count)]
+
+def chunk_ranges(path, chunk_bytes, byte_range=None, min_count=1):
+    """
+    Splits the records of a TSV file (or of a byte range of it) into line-aligned byte
+    ranges of at most about `chunk_bytes` each, and into at least `min_count` ranges.
+    """
+    if byte_range is None:
+        with open(path, 'rb') as infile:
+            byte_range = (len(infile.readline()), os.path.getsize(path))
+    count = max(min_count, -(-(byte_range[1] - byte_range[0]) // chunk_bytes), 1)
+    return shard_ranges(path, count, byte_range)
+
+def read_range(path, byte_range):
+    """
+    Returns the header line followed by the lines of a byte range.
+    """
+    start, end = byte_range
+    with open(path, 'rb') as infile:
+        header = infile.readline()
+        infile.seek(start)
+        return header + infile.read(end - start)
+
+def merge_tsvs(input_tsvs, output_tsv):
+    """
+    Concatenates TSV files with the same header, keeping the header of the first one.
+    """
+    with open(output_tsv, 'wb') as outfile:
+        for i, input_tsv in enumerate(input_tsvs):
+            with open(input_tsv, 'rb') as infile:
+                header = infile.readline()
+                if i == 0:
+                    outfile.write(header)
+                shutil.copyfileobj(infile, outfile)
+
+def merge_columns(input_dirs, criteria, output_dir):
+    """
+    Concatenates the .npy criterion columns of the shards into one array per criterion.
+    """
+    for criterion in criteria:
+        columns = [open_column(column_path(directory, criterion)) for directory in input_dirs]
+        merged = np.lib.format.open_memmap(column_path(output_dir, criterion), mode='w+', dtype=np.int8,
+                                           shape=(sum(len(column) for column in columns),))
+        start = 0
+        for column in columns:
+            merged[start:start + len(column)] = column
+            start += len(column)
+        merged.flush()
+        del merged
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concatenate the outputs of criteria shards in shard order.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--log_file', required=False, help="Path to the log file.")
+    instrumentation.add_arguments(common)
+
+    merge_parser = subparsers.add_parser('merge', parents=[common], help="Concatenate shard outputs.")
+    merge_parser.add_argument('--inputs', nargs='+', required=True, help="Shard output TSV files, or shard directories of .npy columns, in shard order.")
+    merge_parser.add_argument('--criteria', required=False, help="String of criteria separated by spaces; merges .npy columns when given.")
+    merge_parser.add_argument('--output', required=True, help="Path to the output TSV file, or directory for the .npy columns.")
+    args = parser.parse_args()
+
+    logging.basicConfig(filename=args.log_file, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    instrumentation.start('merge_shards', args.metrics_json, args.profile)
+
+    with instrumentation.phase('write'):
+        if args.criteria:
+            merge_columns(args.inputs, args.criteria.split(), args.output)
+        else:
+            merge_tsvs(args.inputs, args.output)
+    logging.info(f"Merged {len(args.inputs)} shards into {args.output}")
@@ -0,0 +1,104 @@
+"""
+Script: target_list.py
+Description: This module restricts the curation to the taxa of a target list (e.g. a national
+             gap list). The list is loaded into a hash index from normalized names (accepted
+             names and their synonyms) to the accepted name. Records are matched on the column
+             of the configured taxon level and on the kingdom; names are normalized once per
+             distinct value in a chunk, so matching a chunk is a single dictionary lookup per
+             distinct name.
+Input:
+    - target_list: CSV file with one taxon per line; the first name is the accepted name as it
+      appears in the list, the other names (separated by semicolons) are its synonyms.
+Output:
+    - target_matches_tsv: TSV file mapping each accepted name to the names it was matched
+      under in the BOLD data, with the number of records per name.
+"""
+
+import csv
+import logging
+from collections import Counter
+import pandas as pd
+
+# Taxon levels whose names have more than one word
+MULTI_WORD_LEVELS = {'species', 'subspecies'}
+
+def normalize_name(name, taxon_level='species'):
+    """
+    Normalizes a taxon name for matching: case-folded, single spaces and without authorship
+    (from the first parenthesized, comma-terminated or 4-digit year word after the genus, e.g.
+    "Bombus terrestris (Linnaeus, 1758)" becomes "bombus terrestris"). In names with a
+    lower-case epithet, a capitalized word also starts the authorship; in names written in
+    capitals it cannot be told apart from an epithet, so "BOMBUS TERRESTRIS LINNAEUS" is kept whole.
+    """
+    words = str(name).replace('_', ' ').split()
+    if taxon_level not in MULTI_WORD_LEVELS:
+        words = words[:1]
+    capitalized_authorship = len(words) > 1 and words[1][0].islower()
+    for i, word in enumerate(words[1:], start=1):
+        year = word.rstrip(',')
+        if word[0] == '(' or word.endswith(',') or (year.isdigit() and len(year) == 4) or \
+                (capitalized_authorship and word[0].isupper()):
+            words = words[:i]
+            break
+    return ' '.join(words).casefold()
+
+def read_target_list(target_list, taxon_level='species'):
+    """
+    Returns the index from normalized accepted names and synonyms to the accepted name.
+    Accepted names take precedence over synonyms; a synonym of several accepted names is
+    kept for the first one.
+    """
+    with open(target_list, encoding='utf-8-sig', newline='') as f:
+        rows = [[name.strip() for name in row if name.strip()] for row in csv.reader(f, delimiter=';')]
+    rows = [row for row in rows if row]
+
+    index = {}
+    for row in rows:
+        index.setdefault(normalize_name(row[0], taxon_level), row[0])
+    ambiguous = 0
+    for row in rows:
+        for synonym in row[1:]:
+            if index.setdefault(normalize_name(synonym, taxon_level), row[0]) != row[0]:
+                ambiguous += 1
+    if ambiguous:
+        logging.warning(f"{ambiguous} synonyms in {target_list} are also names or synonyms of other taxa; they are matched to the first one")
+    logging.info(f"Loaded {len(rows)} target names with {len(index) - len(rows)} synonyms from {target_list}")
+    return index
+
+def match_targets(chunk, index, taxon_level='species', kingdom=None):
+    """
+    Returns the accepted target name of every record in a chunk, or NA for records that are
+    not on the target list or not in the kingdom.
+    """
+    names = chunk[taxon_level].astype(object)
+    lookup = {name: index.get(normalize_name(name, taxon_level)) for name in names.unique()}
+    targets = names.map(lookup)
+    if kingdom:
+        targets[chunk['kingdom'].str.casefold() != kingdom.casefold()] = None
+    return targets
+
+class TargetMatches:
+    """
+    Counts the records matched per accepted name and name in the BOLD data.
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+
+    def add(self, chunk, targets, taxon_level='species'):
+        """
+        Counts the matched records of a chunk.
+        """
+        matched = targets.notna()
+        pairs = pd.DataFrame({'target': targets[matched], 'name': chunk.loc[matched, taxon_level]})
+        self.counts.update(pairs.value_counts().to_dict())
+
+    def write(self, target_matches_tsv):
+        """
+        Writes the accepted name, matched name and number of records of every match.
+        """
+        with open(target_matches_tsv, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+            writer.writerow(['target_name', 'matched_name', 'records'])
+            for (target, name), records in sorted(self.counts.items()):
+                writer.writerow([target, name, records])